@@ -0,0 +1,270 @@
+"""Time each stage of the plot scripts on synthetic data, without the FigShare
+datasets. An unstructured grid of tetrahedra and a 2D image with the Vx_mm_s,
+Vy_mm_s and Vxy_mm_s point data of analytic flow through a tube with a bulge
+(see utils/synthlib.py) are written to a temporary directory. Each stage, from
+reading the VTU-file to writing the plots, is then run a number of times on
+them and the times are written to a JSON-file, together with the commit and
+package versions.
+
+Before that, the time to import each of the utils and scripts is measured in a
+fresh interpreter, less the startup time of the interpreter. --imports limits
+the benchmark to these.
+
+With --compare, the best times of two JSON-files, e.g. of two commits, are
+compared per stage and stages that got slower than --threshold times the base
+are reported. The exit status is 1 if there are any.
+
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+from utils import iolib
+from utils import lazyvtk as vtk
+from utils import plotlib
+from utils import synthlib
+from utils import vtklib
+import contourplot_xyplane
+import contourplot_yzplane
+import lineplot_yaxis
+import streamplot_xyplane
+
+
+root = os.path.join(os.path.dirname(__file__), os.pardir)
+
+# modules of which the import time is measured, in order of dependence
+importmodules = ['utils.numpylib', 'utils.iolib', 'utils.vtklib',
+                 'utils.plotlib', 'contourplot_xyplane', 'contourplot_yzplane',
+                 'streamplot_xyplane', 'lineplot_yaxis', 'make_figures']
+
+
+def getcommit():
+    """Return hash of the checked out commit, with '+' appended if the working
+    tree has changes, or None outside a git repository."""
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         cwd=root, stderr=subprocess.DEVNULL)
+        status = subprocess.check_output(['git', 'status', '--porcelain',
+                                          '--untracked-files=no'],
+                                         cwd=root, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit.decode().strip() + ('+' if status.strip() else '')
+
+
+def copyslice(polydata):
+    """Return shallow copy of slice polydata, so that its meshes are not taken
+    from the cache of plotlib.getslicemesh."""
+    copy = vtk.vtkPolyData()
+    copy.ShallowCopy(polydata)
+    return copy
+
+
+def timestage(function, repeat):
+    """Call function repeat times; return its last result and the wall time
+    of each call in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return result, times
+
+
+def timeimport(module, repeat):
+    """Return wall times in seconds of repeat imports of module, each in a
+    fresh interpreter, less the startup time of the interpreter."""
+    def run(statement):
+        return lambda: subprocess.check_call(
+            [sys.executable, '-c', statement],
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+    startup = min(timestage(run('pass'), repeat)[1])
+    return [t - startup
+            for t in timestage(run('import ' + module), repeat)[1]]
+
+
+def benchmarkimports(repeat=3):
+    """Time the imports of importmodules. Returns dict of the times of all
+    runs and the best and median time per module."""
+    stages = {}
+    for module in importmodules:
+        times = timeimport(module, repeat)
+        stages['import ' + module] = dict(best=min(times),
+                                          median=float(np.median(times)),
+                                          times=times)
+        print('{:28s} {:9.3f} s'.format('import ' + module, min(times)))
+    return stages
+
+
+def benchmark(directory, numberofcells=1e6, pivspacing=0.1, repeat=3):
+    """Write synthetic datasets to directory and time each stage on them.
+    Returns dict of the number of cells and points and, per stage, the times
+    of all runs and the best and median time."""
+    vtupath = os.path.join(directory, 'tube.vtu')
+    vtipath = os.path.join(directory, 'tube.vti')
+    iolib.writevtu(synthlib.tubegrid(numberofcells), vtupath)
+    iolib.writevti(synthlib.tubeimage(pivspacing), vtipath)
+    ofile = os.path.join(directory, 'plot.pdf')
+
+    stages = {}
+
+    def run(name, function):
+        result, times = timestage(function, repeat)
+        stages[name] = dict(best=min(times), median=float(np.median(times)),
+                            times=times)
+        print('{:28s} {:9.3f} s'.format(name, min(times)))
+        return result
+
+    # reading
+    cfd = run('readvtu', lambda: iolib.readvtu(vtupath))
+    piv = run('readvti', lambda: iolib.readvti(vtipath))
+
+    # xy-slice, as in contourplot_xyplane.py and streamplot_xyplane.py
+    xyslice = run('slicedataset', lambda: vtklib.slicedataset(
+        cfd, [0, 0, 0], [0, 0, 1], cache=False))
+    surface = run('triangulate', lambda: vtklib.triangulate(xyslice))
+    run('extract', lambda: plotlib.SliceMesh.frompolydata(surface))
+    settings = contourplot_xyplane.plotsettings
+    simplified = run('simplify', lambda: vtklib.simplify(
+        surface, settings['tolerance']))
+    mesh = plotlib.SliceMesh.frompolydata(simplified)
+
+    def contour():
+        fig = plt.figure()
+        ax = fig.add_subplot(111)
+        ax.tricontourf(mesh.x, mesh.y, mesh.triangles,
+                       mesh.fields['Vxy_mm_s'],
+                       levels=np.linspace(0, 100, 101), cmap='RdBu_r',
+                       extend='both')
+        plt.close(fig)
+    run('tricontourf', contour)
+
+    run('samplepiv', lambda: contourplot_xyplane.samplepiv(piv, xyslice))
+
+    # complete plots, including slice meshes and writing the PDF-file
+    run('contourplot_xyplane', lambda: contourplot_xyplane.contourplot(
+        copyslice(xyslice), ofile=ofile, **settings))
+    run('streamplot_xyplane', lambda: streamplot_xyplane.streamplot(
+        cfd, ofile=ofile, xyslice=copyslice(xyslice),
+        **streamplot_xyplane.plotsettings))
+
+    # yz-slice and y-axis, as in contourplot_yzplane.py and lineplot_yaxis.py
+    yzslice = run('slicedataset_yz', lambda: vtklib.slicedataset(
+        cfd, [3, 0, 0], [1, 0, 0], cache=False))
+    run('slice_edge', lambda: contourplot_yzplane.slice_edge(yzslice))
+    run('contourplot_yzplane', lambda: contourplot_yzplane.contourplot(
+        copyslice(yzslice), ofile=ofile, **contourplot_yzplane.plotsettings))
+    run('extract_vxy_vs_y', lambda: lineplot_yaxis.extract_vxy_vs_y(cfd))
+
+    # stack of 50 yz-slices, as in contourplot_stack.py, and the same slices
+    # one by one
+    offsets = np.linspace(-6, 6, 50)
+    run('slicedatasetstack', lambda: vtklib.slicedatasetstack(
+        cfd, [0, 0, 0], [1, 0, 0], offsets))
+    run('slicedataset_x50', lambda: [vtklib.slicedataset(
+        cfd, [offset, 0, 0], [1, 0, 0], cache=False) for offset in offsets])
+
+    return dict(cells=cfd.GetNumberOfCells(), points=cfd.GetNumberOfPoints(),
+                stages=stages)
+
+
+def compare(base, new, threshold=1.2):
+    """Print best times of stages in results base and new and their ratio.
+    Returns names of stages that are slower than threshold times the base."""
+    if base['cells'] != new['cells']:
+        print('warning: number of cells differs ({} vs. {})'.format(
+            base['cells'], new['cells']))
+    print('{:28s} {:>9s} {:>9s} {:>7s}'.format('stage', 'base [s]', 'new [s]',
+                                               'ratio'))
+    slower = []
+    names = list(base['stages']) + [name for name in new['stages']
+                                    if name not in base['stages']]
+    for name in names:
+        if name not in base['stages'] or name not in new['stages']:
+            print('{:28s} (only in {:s})'.format(
+                name, 'base' if name in base['stages'] else 'new'))
+            continue
+        basetime = base['stages'][name]['best']
+        newtime = new['stages'][name]['best']
+        ratio = newtime / basetime if basetime > 0 else np.inf
+        flag = ''
+        if ratio > threshold:
+            slower.append(name)
+            flag = ' slower'
+        print('{:28s} {:9.3f} {:9.3f} {:7.2f}{:s}'.format(
+            name, basetime, newtime, ratio, flag))
+    return slower
+
+
+#==============================================================================
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--cells', type=float, default=1e6,
+                        help='approximate number of cells of the synthetic '
+                             'grid (default: 1e6)')
+    parser.add_argument('--piv-spacing', type=float, default=0.1,
+                        help='spacing of the synthetic image in mm '
+                             '(default: 0.1)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of runs of each stage (default: 3)')
+    parser.add_argument('--imports', action='store_true',
+                        help='only time the imports')
+    parser.add_argument('--output',
+                        help='JSON-file to write the results to (default: '
+                             'benchmarks/<commit>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'),
+                        help='compare two JSON-files instead of running the '
+                             'benchmark')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='ratio of best times above which --compare '
+                             'reports a stage as slower (default: 1.2)')
+    args = parser.parse_args()
+
+    if args.compare:
+        results = []
+        for path in args.compare:
+            with open(path) as f:
+                results.append(json.load(f))
+        slower = compare(*results, threshold=args.threshold)
+        sys.exit(1 if slower else 0)
+
+    matplotlib.use('Agg')  # time the stages without an interactive backend
+    commit = getcommit()
+    output = args.output
+    if output is None:
+        output = os.path.join(root, 'benchmarks',
+                              (commit or 'unknown')[:12] + '.json')
+
+    stages = benchmarkimports(args.repeat)
+    if args.imports:
+        results = dict(cells=None, points=None, stages=stages)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            results = benchmark(directory, args.cells, args.piv_spacing,
+                                args.repeat)
+        stages.update(results['stages'])
+        results['stages'] = stages
+    results.update(
+        commit=commit, date=time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        repeat=args.repeat, platform=platform.platform(),
+        processor=platform.processor(), cpus=os.cpu_count(),
+        versions=dict(python=platform.python_version(),
+                      vtk=vtk.vtkVersion.GetVTKVersion(),
+                      numpy=np.__version__,
+                      matplotlib=matplotlib.__version__))
+
+    if os.path.dirname(output) and not os.path.exists(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('written to ' + output)
@@ -0,0 +1,198 @@
+"""Measure how the stages of contourplot_xyplane.py and streamplot_xyplane.py
+scale with the number of cells of the CFD dataset. For each size, e.g. 10^5 to
+10^8 cells, a synthetic grid of analytic flow through a tube with a bulge (see
+utils/synthlib.py) is generated in a separate process, which then runs the
+slice, triangulate, extract and plot stages on it and records the wall time
+and peak resident memory (RSS) of each stage. A size that fails, e.g. because
+the process runs out of memory, keeps the stages it completed and shows which
+stage broke.
+
+Per stage, the results of all sizes are printed along with the exponent of the
+power law that fits them best (the slope in a log-log plot): about 1 for a
+stage that scales linearly with the number of cells, 2/3 for one that scales
+with the cells in a slice, and more than 1 for one that scales worse than
+linearly. All results are written to a JSON-file.
+
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+from utils import proflib
+
+
+root = os.path.join(os.path.dirname(__file__), os.pardir)
+
+
+def runstages(numberofcells, directory, output):
+    """Generate grid of numberofcells and run the stages on it, writing the
+    results to JSON-file output after each stage."""
+    from utils import plotlib
+    from utils import synthlib
+    from utils import vtklib
+    import contourplot_xyplane
+    import streamplot_xyplane
+    from benchmark import copyslice
+
+    results = dict(stages={})
+    ofile = os.path.join(directory, 'plot.pdf')
+
+    def run(name, function):
+        rss = proflib.getrss()[0]
+        proflib.resetpeakrss()
+        start = time.perf_counter()
+        result = function()
+        wall = time.perf_counter() - start
+        peak = proflib.getrss()[1]
+        results['stages'][name] = dict(time=wall, rss=rss, peakrss=peak,
+                                       memory=peak - rss)
+        with open(output, 'w') as f:
+            json.dump(results, f)
+        return result
+
+    def generate():
+        # recorded with the generate stage, so that also the results of runs
+        # that fail later have the actual size
+        grid = synthlib.tubegrid(numberofcells)
+        results.update(cells=grid.GetNumberOfCells(),
+                       points=grid.GetNumberOfPoints())
+        return grid
+
+    cfd = run('generate', generate)
+    xyslice = run('slicedataset', lambda: vtklib.slicedataset(
+        cfd, [0, 0, 0], [0, 0, 1], cache=False))
+    surface = run('triangulate', lambda: vtklib.triangulate(xyslice))
+    run('extract', lambda: plotlib.SliceMesh.frompolydata(surface))
+    run('simplify', lambda: vtklib.simplify(
+        surface, contourplot_xyplane.plotsettings['tolerance']))
+    run('contourplot_xyplane', lambda: contourplot_xyplane.contourplot(
+        copyslice(xyslice), ofile=ofile, **contourplot_xyplane.plotsettings))
+    run('streamplot_xyplane', lambda: streamplot_xyplane.streamplot(
+        cfd, ofile=ofile, xyslice=copyslice(xyslice),
+        **streamplot_xyplane.plotsettings))
+    results['complete'] = True
+    with open(output, 'w') as f:
+        json.dump(results, f)
+
+
+def measure(numberofcells, timeout=None):
+    """Run the stages for numberofcells in a separate process. Returns dict of
+    the results of the completed stages, with an error message if the process
+    failed."""
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, 'results.json')
+        command = [sys.executable, os.path.abspath(__file__),
+                   '--worker', repr(numberofcells), output]
+        try:
+            process = subprocess.run(command, stderr=subprocess.PIPE,
+                                     timeout=timeout)
+            error = None
+            if process.returncode < 0:
+                error = 'killed by signal {:d}'.format(-process.returncode)
+            elif process.returncode > 0:
+                lines = process.stderr.decode(errors='replace').splitlines()
+                error = lines[-1] if lines else 'exit status {:d}'.format(
+                    process.returncode)
+        except subprocess.TimeoutExpired:
+            error = 'timeout after {:g} s'.format(timeout)
+        results = dict(stages={})
+        if os.path.exists(output):
+            with open(output) as f:
+                results = json.load(f)
+    if results.get('complete'):
+        error = None  # failed on exit
+    results.update(target=numberofcells, error=error)
+    return results
+
+
+def powerlaw(cells, values):
+    """Return exponent of the power law fitted to the positive values as a
+    function of cells, or nan if there are less than two."""
+    cells, values = np.asarray(cells, float), np.asarray(values, float)
+    positive = values > 0
+    if positive.sum() < 2:
+        return np.nan
+    return np.polyfit(np.log(cells[positive]), np.log(values[positive]), 1)[0]
+
+
+def report(sweep):
+    """Print time and peak RSS of each stage per size of sweep and their
+    power-law exponents."""
+    names = []
+    for results in sweep:
+        names += [name for name in results['stages'] if name not in names]
+    print('{:20s} '.format('cells') + ' '.join(
+        '{:>16.3g}'.format(results.get('cells', results['target']))
+        for results in sweep) + ' {:>7s} {:>7s}'.format('slope t', 'slope m'))
+    for name in names:
+        row, cells, times, memory = [], [], [], []
+        for results in sweep:
+            stage = results['stages'].get(name)
+            if stage is None:
+                row.append('{:>16s}'.format('-'))
+                continue
+            row.append('{:7.2f} s {:4.0f} MB'.format(stage['time'],
+                                                     stage['peakrss'] / 1e6))
+            cells.append(results.get('cells', results['target']))
+            times.append(stage['time'])
+            memory.append(stage['memory'])
+        print('{:20s} '.format(name) + ' '.join(row) +
+              ' {:7.2f} {:7.2f}'.format(powerlaw(cells, times),
+                                        powerlaw(cells, memory)))
+    for results in sweep:
+        if results['error']:
+            stages = list(results['stages'])
+            print('{:.3g} cells failed after {:s}: {:s}'.format(
+                results['target'], stages[-1] if stages else 'start',
+                results['error']))
+
+
+#==============================================================================
+
+if __name__ == '__main__':
+
+    if len(sys.argv) == 4 and sys.argv[1] == '--worker':
+        import matplotlib
+        matplotlib.use('Agg')  # measure the stages as in batch runs
+        runstages(float(sys.argv[2]), os.path.dirname(sys.argv[3]),
+                  sys.argv[3])
+        sys.exit()
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--cells', type=float, nargs='+',
+                        default=[1e5, 1e6, 1e7, 1e8],
+                        help='approximate numbers of cells of the synthetic '
+                             'grids (default: 1e5 1e6 1e7 1e8)')
+    parser.add_argument('--timeout', type=float,
+                        help='time limit in seconds per size (default: none)')
+    parser.add_argument('--output',
+                        help='JSON-file to write the results to (default: '
+                             'benchmarks/scaling-<commit>.json)')
+    args = parser.parse_args()
+
+    import benchmark
+    commit = benchmark.getcommit()
+    output = args.output
+    if output is None:
+        output = os.path.join(root, 'benchmarks',
+                              'scaling-' + (commit or 'unknown')[:12] +
+                              '.json')
+
+    sweep = []
+    for numberofcells in sorted(args.cells):
+        print('{:.3g} cells'.format(numberofcells))
+        sweep.append(measure(numberofcells, args.timeout))
+    report(sweep)
+
+    if os.path.dirname(output) and not os.path.exists(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+    with open(output, 'w') as f:
+        json.dump(dict(commit=commit, sweep=sweep,
+                       date=time.strftime('%Y-%m-%dT%H:%M:%S%z')), f,
+                  indent=2)
+    print('written to ' + output)
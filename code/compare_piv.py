@@ -0,0 +1,76 @@
+"""Compare the velocity of the CFD datasets with the PIV image. The PIV image is
+sampled at all points of each CFD dataset that lie within the extent of the
+image, by trilinear interpolation on the image grid (see numpylib.sampleimage),
+and at the points of the CFD xy-slice at z = 0 mm. For both point sets and each
+velocity component, the number of points, the root-mean-square and mean
+difference (CFD - PIV) and the correlation coefficient are printed. If the PIV
+image is 2D, the volume comparison only includes CFD points in its plane.
+
+As in contourplot_xyplane.py, the x < -6 mm region of the PIV image is
+discarded by default, because of an imaging artifact.
+
+"""
+
+import os
+import argparse
+import numpy as np
+from utils import iolib
+from utils import numpylib
+from utils import vtklib
+
+
+fields = ['Vx_mm_s', 'Vy_mm_s', 'Vxy_mm_s']
+
+
+def compare(piv, dataset, xmin=-np.inf):
+    """Return (count, rms, mean difference, correlation) per field of the
+    velocity of dataset vs. that of the piv image, at the points of dataset
+    that lie within the image and at x >= xmin"""
+    points = numpylib.getpoints(dataset)
+    samples = numpylib.sampleimage(piv, points, fields)
+    statistics = {}
+    for name in fields:
+        valid = ~np.ma.getmaskarray(samples[name]) & (points[:, 0] >= xmin)
+        if not valid.any():
+            statistics[name] = (0, np.nan, np.nan, np.nan)
+            continue
+        cfdvalues = numpylib.getpointarray(dataset, name)[valid]
+        pivvalues = samples[name].data[valid]
+        difference = cfdvalues - pivvalues
+        if valid.sum() > 1:
+            correlation = np.corrcoef(cfdvalues, pivvalues)[0, 1]
+        else:
+            correlation = np.nan
+        statistics[name] = (int(valid.sum()),
+                            np.sqrt(np.mean(difference**2)),
+                            np.mean(difference), correlation)
+    return statistics
+
+
+#==============================================================================
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--xmin', type=float, default=-6.,
+                        help='discard points at x < xmin mm (default: -6)')
+    args = parser.parse_args()
+
+    root = os.path.join(os.path.dirname(__file__), os.pardir)
+    piv = iolib.readcached(os.path.join(root, 'data', 'piv', 'piv.vti'),
+                           os.path.join(root, 'data', 'cache', 'piv'),
+                           fields=fields)
+
+    print('{:6s} {:6s} {:9s} {:>9s} {:>9s} {:>9s} {:>6s}'.format(
+        'case', 'region', 'field', 'points', 'rms', 'mean', 'corr'))
+    cases = ['case' + str(i).zfill(1) for i in range(6)]
+    for case in cases:
+        cfd = iolib.readcached(
+            os.path.join(root, 'data', 'cfd', case + '.vtu'),
+            os.path.join(root, 'data', 'cache', case), fields=fields)
+        xyslice = vtklib.slicedataset(cfd, [0, 0, 0], [0, 0, 1])
+        for region, dataset in [('volume', cfd), ('xy', xyslice)]:
+            statistics = compare(piv, dataset, xmin=args.xmin)
+            for name in fields:
+                print('{:6s} {:6s} {:9s} {:9d} {:9.3f} {:9.3f} {:6.3f}'.format(
+                    case, region, name, *statistics[name]))
@@ -0,0 +1,65 @@
+"""Contour plots on a stack of parallel slices, to scan the aneurysm. The CFD
+dataset of a case is sliced with all xy-planes (z = const) or yz-planes
+(x = const) at once, in a single pass of the cutter. For each slice, a contour
+plot is created as in contourplot_xyplane.py (in-plane velocity) or
+contourplot_yzplane.py (out-of-plane velocity).
+
+"""
+
+import os
+import argparse
+import numpy as np
+from utils import iolib
+from utils import proflib
+from utils import vtklib
+import contourplot_xyplane
+import contourplot_yzplane
+
+
+parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+parser.add_argument('--case', default='case0',
+                    help='cfd dataset to slice (default: case0)')
+parser.add_argument('--plane', choices=['xy', 'yz'], default='yz',
+                    help='orientation of the slices (default: yz)')
+parser.add_argument('--start', type=float, default=-6.,
+                    help='location of first slice in mm (default: -6)')
+parser.add_argument('--stop', type=float, default=6.,
+                    help='location of last slice in mm (default: 6)')
+parser.add_argument('--num', type=int, default=50,
+                    help='number of slices (default: 50)')
+proflib.addarguments(parser)
+args = parser.parse_args()
+proflib.enable(args.profile, args.cprofile)
+
+root = os.path.join(os.path.dirname(__file__), os.pardir)
+path = os.path.join(root, 'figs', 'contourplot_stack',
+                    args.case + '_' + args.plane + 'plane')
+if not os.path.exists(path):
+    os.makedirs(path)
+
+# read cfd data and extract all slices
+cfd = iolib.readvtu(os.path.join(root, 'data', 'cfd', args.case + '.vtu'))
+locations = np.linspace(args.start, args.stop, args.num)
+if args.plane == 'xy':
+    normal = [0, 0, 1]
+else:
+    normal = [1, 0, 0]
+slices = vtklib.slicedatasetstack(cfd, [0, 0, 0], normal, locations)
+
+axis = 'z' if args.plane == 'xy' else 'x'
+for location, stackslice in zip(locations, slices):
+
+    name = '{:s}{:+.2f}'.format(axis, location)
+    if stackslice.GetNumberOfCells() == 0:
+        print(name + ' (empty)')
+        continue
+    print(name)
+
+    with proflib.stage(name):
+        ofile = os.path.join(path, name + '.pdf')
+        if args.plane == 'xy':
+            contourplot_xyplane.contourplot(stackslice, ofile=ofile,
+                                            **contourplot_xyplane.plotsettings)
+        else:
+            contourplot_yzplane.contourplot(stackslice, ofile=ofile,
+                                            **contourplot_yzplane.plotsettings)
@@ -1,113 +1,152 @@
-"""Contour plots of the in-plane velocity (i.e. xy-velocity) on the xy-slice. The
-slices are obtained by slicing the CFD datasets (vtu format) with the xy-plane
-at z = 0 mm. To create a corresponding contour plot for the PIV dataset, we
-sample the PIV image with the CFD xy-slice of case 0.
-
-We discarded the x < 6 mm region of the PIV image from data analysis, because we
-considered the particularly low velocity values in that region to be the result
-of an imaging artifact. For the contour plots, the lower value of the x plot
-range was therefore set to x = -6. Only a small part of the artifact is still
-visible in the upper left corner. As described in the paper's Discussion,
-slight inaccuracies in the refractive index matching between glass and fluid can
-lead to inaccuracies in the measured velocity field, most notably in regions
-where the normal on the glass surface is nearly perpendicular to the optical
-axis. Near x = 6 mm, outlet 2 branched off from the right ACA-A1 (the aneurysm's
-parent vessel), which could explain the imaging artifacts we are seeing.
-
-"""
-
-import os
-import vtk
-import numpy as np
-import matplotlib.pyplot as plt
-from utils import iolib
-from utils import vtklib
-
-
-def samplepiv(piv, xyslice):
-    """Sample piv image with xyslice"""
-    prober = vtk.vtkProbeFilter()
-    prober.SetInputData(xyslice)
-    prober.SetSourceData(piv)
-    prober.Update()
-    return prober.GetOutput()
-
-
-def contourplot(xyslice, ofile='contourplot.pdf', xmin=0, xmax=1,
-                ymin=0, ymax=1, hidelabels=False):
-    """Create contourplot on xyslice"""
-    xyslice = vtklib.triangulate(xyslice)
-
-    # data size
-    numberofpoints = xyslice.GetNumberOfPoints()
-    numberofcells = xyslice.GetNumberOfCells()
-
-    # nparrays for x, y, vxy
-    x = np.empty(numberofpoints)
-    y = np.empty(numberofpoints)
-    vxy = np.empty(numberofpoints)
-    for i in range(numberofpoints):
-        x[i] = xyslice.GetPoint(i)[0]
-        y[i] = xyslice.GetPoint(i)[1]
-        vxy[i] = xyslice.GetPointData().GetArray('Vxy_mm_s').GetValue(i)
-
-    # array defining pointids per triangle
-    triangles = np.empty(shape=(numberofcells, 3))
-    for i in range(numberofcells):
-        cellpointids = xyslice.GetCell(i).GetPointIds()
-        for j in range(cellpointids.GetNumberOfIds()):
-            triangles[i, j] = cellpointids.GetId(j)
-
-    # initialize figure
-    fig = plt.figure()
-    ax = fig.add_subplot(111)
-
-    # plot filled contours
-    cplot = ax.tricontourf(x, y, triangles, vxy,
-                           levels=np.linspace(0, 100, 21),
-                           cmap='RdBu_r', extend='both')
-
-    # set axes labels and ticks
-    ax.set_xlim(xmin, xmax)
-    ax.set_ylim(ymin, ymax)
-    ax.set_xlabel('x [mm]', fontsize=36)
-    ax.set_ylabel('y [mm]', fontsize=36)
-    plt.setp(ax.get_xticklabels(), fontsize=32)
-    plt.setp(ax.get_yticklabels(), fontsize=32)
-    if hidelabels:
-        # do not show axes labels and ticks
-        ax.get_xaxis().set_visible(False)
-        ax.get_yaxis().set_visible(False)
-
-    # write figure
-    ax.set_aspect('equal')
-    ax.set_rasterization_zorder(2.0)  # rasterize contour, vector rest
-    fig.savefig(ofile, bbox_inches="tight", dpi=200)
-    plt.close(fig)
-
-
-#==============================================================================
-
-root = os.path.join(os.path.dirname(__file__), os.pardir)
-path = os.path.join(root, 'figs', 'contourplot_xyplane')
-if not os.path.exists(path):
-    os.makedirs(path)
-
-datasets = ['case' + str(i).zfill(1) for i in range(6)] + ['piv']
-for dataset in datasets:
-
-    print(dataset)
-
-    if dataset == 'piv':
-        # read piv image and probe with cfd xyslice of case 0
-        piv = iolib.readvti(os.path.join(root, 'data', 'piv', dataset + '.vti'))
-        cfd = iolib.readvtu(os.path.join(root, 'data', 'cfd', 'case0.vtu'))
-        xyslice_cfd = vtklib.slicedataset(cfd, [0, 0, 0], [0, 0, 1])
-        xyslice = samplepiv(piv, xyslice_cfd)
-    else:
-        # read cfd data and extract xyslice
-        cfd = iolib.readvtu(os.path.join(root, 'data', 'cfd', dataset + '.vtu'))
-        xyslice = vtklib.slicedataset(cfd, [0, 0, 0], [0, 0, 1])
-
-    contourplot(xyslice, ofile=os.path.join(path, dataset + '.pdf'),
-                xmin=-6, xmax=6, ymin=-7, ymax=5, hidelabels=True)
+"""Contour plots of the in-plane velocity (i.e. xy-velocity) on the xy-slice. The
+slices are obtained by slicing the CFD datasets (vtu format) with the xy-plane
+at z = 0 mm. To create a corresponding contour plot for the PIV dataset, we
+sample the PIV image with the CFD xy-slice of case 0.
+
+We discarded the x < 6 mm region of the PIV image from data analysis, because we
+considered the particularly low velocity values in that region to be the result
+of an imaging artifact. For the contour plots, the lower value of the x plot
+range was therefore set to x = -6. Only a small part of the artifact is still
+visible in the upper left corner. As described in the paper's Discussion,
+slight inaccuracies in the refractive index matching between glass and fluid can
+lead to inaccuracies in the measured velocity field, most notably in regions
+where the normal on the glass surface is nearly perpendicular to the optical
+axis. Near x = 6 mm, outlet 2 branched off from the right ACA-A1 (the aneurysm's
+parent vessel), which could explain the imaging artifacts we are seeing.
+
+"""
+
+import os
+import argparse
+import numpy as np
+import matplotlib.pyplot as plt
+from utils import buildlib
+from utils import iolib
+from utils import lazyvtk as vtk
+from utils import numpylib
+from utils import plotlib
+from utils import proflib
+from utils import vtklib
+
+
+@proflib.profiled
+def samplepiv(piv, xyslice):
+    """Sample piv image with xyslice
+
+    The point data of piv is interpolated trilinearly at the points of xyslice
+    (see numpylib.sampleimage). As with vtkProbeFilter, points outside the
+    image get zero values.
+
+    """
+    pointdata = piv.GetPointData()
+    names = [pointdata.GetArrayName(i)
+             for i in range(pointdata.GetNumberOfArrays())]
+    samples = numpylib.sampleimage(piv, numpylib.getpoints(xyslice), names)
+
+    sampled = vtk.vtkPolyData()
+    sampled.CopyStructure(xyslice)
+    for name, values in samples.items():
+        sampled.GetPointData().AddArray(
+            numpylib.makearray(np.ma.filled(values, 0), name))
+    return sampled
+
+
+@proflib.profiled
+def contourplot(xyslice, ofile='contourplot.pdf', xmin=0, xmax=1,
+                ymin=0, ymax=1, hidelabels=False, tolerance=None,
+                targetcells=None):
+    """Create contourplot on xyslice
+
+    The triangulated xyslice is simplified before contouring if tolerance (in
+    mm, e.g. the pixel size) or targetcells is given (see vtklib.simplify). Its
+    mesh is cached and shared with other plots of xyslice (see
+    plotlib.getslicemesh).
+
+    """
+    mesh = plotlib.getslicemesh(xyslice, (0, 1), tolerance, targetcells)
+
+    # initialize figure
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+
+    # plot filled contours
+    with proflib.stage('tricontourf'):
+        cplot = ax.tricontourf(mesh.triangulation, mesh.fields['Vxy_mm_s'],
+                               levels=np.linspace(0, 100, 21),
+                               cmap='RdBu_r', extend='both')
+
+    # set axes labels and ticks
+    ax.set_xlim(xmin, xmax)
+    ax.set_ylim(ymin, ymax)
+    ax.set_xlabel('x [mm]', fontsize=36)
+    ax.set_ylabel('y [mm]', fontsize=36)
+    plt.setp(ax.get_xticklabels(), fontsize=32)
+    plt.setp(ax.get_yticklabels(), fontsize=32)
+    if hidelabels:
+        # do not show axes labels and ticks
+        ax.get_xaxis().set_visible(False)
+        ax.get_yaxis().set_visible(False)
+
+    # write figure
+    ax.set_aspect('equal')
+    ax.set_rasterization_zorder(2.0)  # rasterize contour, vector rest
+    with proflib.stage('savefig') as savefig:
+        fig.savefig(ofile, bbox_inches="tight", dpi=200)
+        savefig.setoutput(ofile)
+    plt.close(fig)
+
+
+#==============================================================================
+
+# plot window, labels and simplification tolerance (about a pixel), shared
+# with make_figures.py
+plotsettings = dict(xmin=-6, xmax=6, ymin=-7, ymax=5, hidelabels=True,
+                    tolerance=0.01)
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    proflib.addarguments(parser)
+    buildlib.addarguments(parser)
+    args = parser.parse_args()
+    proflib.enable(args.profile, args.cprofile)
+
+    root = os.path.join(os.path.dirname(__file__), os.pardir)
+    fingerprints = buildlib.Fingerprints(
+        os.path.join(root, 'figs', 'fingerprints.json'), force=args.force)
+    path = os.path.join(root, 'figs', 'contourplot_xyplane')
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    datasets = ['case' + str(i).zfill(1) for i in range(6)] + ['piv']
+    for dataset in datasets:
+
+        # skip figure if its data, settings and code did not change
+        ofile = os.path.join(path, dataset + '.pdf')
+        if dataset == 'piv':
+            files = [os.path.join(root, 'data', 'piv', 'piv.vti'),
+                     os.path.join(root, 'data', 'cfd', 'case0.vtu')]
+        else:
+            files = [os.path.join(root, 'data', 'cfd', dataset + '.vtu')]
+        fingerprint = fingerprints.compute(files, plotsettings, [__file__])
+        if fingerprints.isuptodate(ofile, fingerprint):
+            print(dataset + ' (up to date)')
+            continue
+
+        print(dataset)
+
+        with proflib.stage(dataset):
+            if dataset == 'piv':
+                # read piv image and probe with cfd xyslice of case 0
+                piv = iolib.readvti(files[0])
+                cfd = iolib.readvtu(files[1])
+                xyslice_cfd = vtklib.slicedataset(cfd, [0, 0, 0],
+                                                  [0, 0, 1])
+                xyslice = samplepiv(piv, xyslice_cfd)
+            else:
+                # read cfd data and extract xyslice
+                cfd = iolib.readvtu(files[0])
+                xyslice = vtklib.slicedataset(cfd, [0, 0, 0], [0, 0, 1])
+
+            contourplot(xyslice, ofile=ofile, **plotsettings)
+        fingerprints.update(ofile, fingerprint)
@@ -0,0 +1,29 @@
+"""Convert the CFD datasets and the PIV image to binary caches for fast loading
+
+The points, cell connectivity, offsets and types, and the point data arrays of
+each data/cfd/caseN.vtu are written as separate npy-files to
+data/cache/caseN, and the geometry and point data arrays of data/piv/piv.vti to
+data/cache/piv. make_figures.py and compare_piv.py memory-map the caches when
+they exist, and load only the velocity arrays they use. Rerun this script when
+the datasets change.
+
+"""
+
+import os
+from utils import iolib
+
+
+root = os.path.join(os.path.dirname(__file__), os.pardir)
+
+cases = ['case' + str(i).zfill(1) for i in range(6)]
+for case in cases:
+
+    print(case)
+
+    cfd = iolib.readvtu(os.path.join(root, 'data', 'cfd', case + '.vtu'))
+    iolib.writecache(cfd, os.path.join(root, 'data', 'cache', case))
+
+print('piv')
+
+piv = iolib.readvti(os.path.join(root, 'data', 'piv', 'piv.vti'))
+iolib.writecache(piv, os.path.join(root, 'data', 'cache', 'piv'))
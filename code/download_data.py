@@ -1,51 +1,142 @@
-import os
-from utils import iolib
-
-
-# find project root and specify url to FigShare
-root = os.path.join(os.path.dirname(__file__), os.pardir)
-figshare = 'https://s3-eu-west-1.amazonaws.com/pfigshare-u-files/'
-
-# create local folders to download data into
-cfdpath = os.path.join(root, 'data', 'cfd')
-pivpath = os.path.join(root, 'data', 'piv')
-inputpath = os.path.join(root, 'data', 'input')
-for path in [cfdpath, pivpath, inputpath]:
-    if not os.path.exists(path):
-        os.makedirs(path)
-
-# location of files on FigShare
-pivurls = ['3196046/piv.vti']
-inputurls = ['3195839/ccs_center.stl', '3195833/ccs_left.stl',
-             '3195851/ccs_right.stl', '3195878/ocs_left.stl',
-             '3195890/ocs_right.stl', '3195863/surface.stl',
-             '3196049/geometry.pdf', '1561674/challenge_instructions.txt']
-cfdurls = ['3196028/case0.vtu', '3196031/case1.vtu', '3196034/case2.vtu',
-           '3196037/case3.vtu', '3196040/case4.vtu', '3196043/case5.vtu',
-           '3196025/cfd_setup.txt']
-
-# download piv data
-print('\r\nDownloading PIV data...')
-for pivurl in pivurls:
-    pivfilename = pivurl.split('/')[1]
-    iolib.download_data(figshare + pivurl,
-                        os.path.join(pivpath, pivfilename))
-
-# download input data
-print('\r\nDownloading input data...')
-for inputurl in inputurls:
-    inputfilename = inputurl.split('/')[1]
-    iolib.download_data(figshare + inputurl,
-                        os.path.join(inputpath, inputfilename))
-
-# download cfd data
-print('\r\nDownloading CFD data...')
-for cfdurl in cfdurls:
-    cfdfilename = cfdurl.split('/')[1]
-    if os.path.splitext(cfdfilename)[1] == '.txt':
-        iolib.download_data(figshare + cfdurl,
-                            os.path.join(cfdpath, cfdfilename))
-    else:
-        iolib.download_data(figshare + cfdurl + '.gz',
-                            os.path.join(cfdpath, cfdfilename), True)
-
+"""Download the input, PIV and CFD data from FigShare into data/
+
+Files are downloaded concurrently and interrupted downloads are resumed. Use
+--url to download from a mirror with the same layout as FigShare, e.g. a
+local `python -m http.server`.
+
+The size, mtime and SHA-256 of every downloaded file are recorded in
+data/manifest.json. Files that are already present and match the manifest
+are not downloaded again, and files that are present but not yet in the
+manifest, e.g. downloaded by an earlier version of this script, are added to
+it. By default, files with the recorded size and mtime
+are trusted; use --verify to check the SHA-256 of all files. Use --check to
+only verify the local files against the manifest, without downloading.
+
+With --keep-compressed, the CFD datasets are stored as gzipped vtu-files, which
+iolib.readvtu reads directly. Pass the option to --check runs as well.
+
+"""
+
+import os
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from utils import iolib
+
+
+parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+parser.add_argument('--url',
+                    default='https://s3-eu-west-1.amazonaws.com/'
+                            'pfigshare-u-files/',
+                    help='base url of the files (default: FigShare)')
+parser.add_argument('--workers', type=int, default=4,
+                    help='number of concurrent downloads and file hashes '
+                         '(default: 4)')
+parser.add_argument('--keep-compressed', action='store_true',
+                    help='store cfd datasets as caseN.vtu.gz instead of '
+                         'decompressing them')
+parser.add_argument('--verify', action='store_true',
+                    help='check SHA-256 of all local files, not only of '
+                         'files with changed mtime')
+parser.add_argument('--check', action='store_true',
+                    help='verify local files against the manifest (SHA-256) '
+                         'without downloading')
+args = parser.parse_args()
+
+# find project root and specify url to FigShare
+root = os.path.join(os.path.dirname(__file__), os.pardir)
+figshare = args.url.rstrip('/') + '/'
+
+# create local folders to download data into
+cfdpath = os.path.join(root, 'data', 'cfd')
+pivpath = os.path.join(root, 'data', 'piv')
+inputpath = os.path.join(root, 'data', 'input')
+for path in [cfdpath, pivpath, inputpath]:
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+# location of files on FigShare
+pivurls = ['3196046/piv.vti']
+inputurls = ['3195839/ccs_center.stl', '3195833/ccs_left.stl',
+             '3195851/ccs_right.stl', '3195878/ocs_left.stl',
+             '3195890/ocs_right.stl', '3195863/surface.stl',
+             '3196049/geometry.pdf', '1561674/challenge_instructions.txt']
+cfdurls = ['3196028/case0.vtu', '3196031/case1.vtu', '3196034/case2.vtu',
+           '3196037/case3.vtu', '3196040/case4.vtu', '3196043/case5.vtu',
+           '3196025/cfd_setup.txt']
+
+# collect (url, destination, decompress) of piv, input and cfd data
+downloads = []
+for pivurl in pivurls:
+    pivfilename = pivurl.split('/')[1]
+    downloads.append((figshare + pivurl,
+                      os.path.join(pivpath, pivfilename), False))
+for inputurl in inputurls:
+    inputfilename = inputurl.split('/')[1]
+    downloads.append((figshare + inputurl,
+                      os.path.join(inputpath, inputfilename), False))
+for cfdurl in cfdurls:
+    cfdfilename = cfdurl.split('/')[1]
+    if os.path.splitext(cfdfilename)[1] == '.txt':
+        downloads.append((figshare + cfdurl,
+                          os.path.join(cfdpath, cfdfilename), False))
+    elif args.keep_compressed:
+        downloads.append((figshare + cfdurl + '.gz',
+                          os.path.join(cfdpath, cfdfilename + '.gz'), False))
+    else:
+        downloads.append((figshare + cfdurl + '.gz',
+                          os.path.join(cfdpath, cfdfilename), True))
+
+# verify local files against manifest
+datapath = os.path.join(root, 'data')
+manifestpath = os.path.join(datapath, 'manifest.json')
+manifest = iolib.readmanifest(manifestpath)
+names = [os.path.relpath(destination, datapath).replace(os.sep, '/')
+         for url, destination, decompress in downloads]
+status = iolib.verifyfiles(datapath, manifest, names,
+                           quick=not (args.verify or args.check),
+                           workers=args.workers)
+
+if args.check:
+    for name in names:
+        print('{:10s}{:s}'.format(status[name], name))
+    sys.exit(0 if all(s == 'ok' for s in status.values()) else 1)
+
+# add files that are present but not in the manifest, i.e. unknown, to it
+unknown = [name for name in names if status[name] == 'unknown']
+with ThreadPoolExecutor(max_workers=args.workers) as executor:
+    entries = executor.map(iolib.fileentry,
+                           [os.path.join(datapath, name) for name in unknown])
+    manifest.update(zip(unknown, entries))
+for name in unknown:
+    status[name] = 'ok'
+
+# download missing and corrupt files only; corrupt files are removed first,
+# so that only the files whose download finished are recorded
+missing = [download for download, name in zip(downloads, names)
+           if status[name] != 'ok']
+print('\r\n{:d} of {:d} files up to date'.format(len(names) - len(missing),
+                                                 len(names)))
+for url, destination, decompress in missing:
+    if os.path.exists(destination):
+        os.remove(destination)
+completed = []
+try:
+    if missing:
+        print('\r\nDownloading PIV, input and CFD data...')
+        iolib.download_files(missing, workers=args.workers,
+                             completed=completed)
+finally:
+    # record size, mtime and SHA-256 of all downloaded files
+    downloaded = [os.path.relpath(destination, datapath).replace(os.sep, '/')
+                  for destination in completed]
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        entries = executor.map(iolib.fileentry,
+                               [os.path.join(datapath, name)
+                                for name in downloaded])
+        manifest.update(zip(downloaded, entries))
+    for name in names:
+        if status[name] == 'ok':
+            manifest[name]['mtime'] = os.stat(
+                os.path.join(datapath, name)).st_mtime
+    iolib.writemanifest(manifestpath, manifest)
@@ -0,0 +1,260 @@
+"""Create the figures of contourplot_xyplane.py, streamplot_xyplane.py,
+contourplot_yzplane.py and lineplot_yaxis.py in a single pass. Each dataset is
+read once and each distinct slice is computed once; the slices are then handed
+to every plot function that needs them.
+
+Each (case, figure) pair is an independent work unit. With --jobs N, the work
+units are spread over a pool of N processes. The CFD datasets are read once, by
+the main process, and published in shared memory; the worker processes attach
+to them without parsing or copying, so memory use stays flat as workers are
+added. Each worker computes the slices of the work units it is handed. Errors
+are reported per work unit without stopping the others. SOURCE_DATE_EPOCH is
+fixed (unless set already), so that the PDF files of a parallel run are
+identical to those of a serial run.
+
+Figures are only created if they are out of date, i.e. if their dataset,
+plot settings or code changed since they were last created, as recorded in
+figs/fingerprints.json (see utils/buildlib.py). With --force, all figures are
+created.
+
+With --profile, the time and memory of each stage of each work unit are
+recorded to a trace file, also by the worker processes (see utils/proflib.py).
+
+"""
+
+import os
+import sys
+import argparse
+import functools
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import matplotlib
+from utils import buildlib
+from utils import iolib
+from utils import proflib
+from utils import vtklib
+import contourplot_xyplane
+import contourplot_yzplane
+import lineplot_yaxis
+import streamplot_xyplane
+
+
+root = os.path.join(os.path.dirname(__file__), os.pardir)
+figures = ['contourplot_xyplane', 'streamplot_xyplane',
+           'contourplot_yzplane', 'lineplot_yaxis']
+cases = ['case' + str(i).zfill(1) for i in range(6)]
+fields = ['Vx_mm_s', 'Vy_mm_s', 'Vxy_mm_s']  # point data used by the plots
+sharedgrids = {}  # handles of cfd datasets in shared memory, by case
+
+
+def datapath(name):
+    """Return path of the VTK file of dataset name, a case or 'piv'"""
+    if name == 'piv':
+        return os.path.join(root, 'data', 'piv', 'piv.vti')
+    return os.path.join(root, 'data', 'cfd', name + '.vtu')
+
+
+@functools.lru_cache(maxsize=1)
+def readpiv():
+    """Read piv image, from its binary cache if it exists (see
+    convert_data.py)"""
+    return iolib.readcached(datapath('piv'),
+                            os.path.join(root, 'data', 'cache', 'piv'),
+                            fields=fields)
+
+
+def loadcfd(case):
+    """Read cfd dataset of case, from its binary cache if it exists (see
+    convert_data.py)"""
+    return iolib.readcached(datapath(case),
+                            os.path.join(root, 'data', 'cache', case),
+                            fields=fields)
+
+
+@functools.lru_cache(maxsize=1)
+def readcfd(case):
+    """Attach to cfd dataset of case if it is in shared memory, else read it"""
+    if case in sharedgrids:
+        return iolib.attachgrid(sharedgrids[case], fields=fields)
+    return loadcfd(case)
+
+
+def setsharedgrids(handles):
+    """Set handles of cfd datasets in shared memory (worker initializer)"""
+    sharedgrids.update(handles)
+
+
+@functools.lru_cache(maxsize=2)
+def getxyslice(case):
+    """Slice cfd dataset of case with the xy-plane at z = 0 mm"""
+    return vtklib.slicedataset(readcfd(case), [0, 0, 0], [0, 0, 1])
+
+
+@functools.lru_cache(maxsize=1)
+def getyzslice(case):
+    """Slice cfd dataset of case with the yz-plane at x = 3 mm"""
+    return vtklib.slicedataset(readcfd(case), [3, 0, 0], [1, 0, 0])
+
+
+def figurepath(case, figure):
+    """Return path of figure for case"""
+    return os.path.join(root, 'figs', figure, case + '.pdf')
+
+
+def fingerprint(fingerprints, case, figure):
+    """Return fingerprint of figure for case (see render), from its datasets,
+    plot settings and code, as computed by the plot script of figure. The VTK
+    files of the datasets count, as the binary caches are made from them."""
+    if case == 'piv':
+        datasets = ['piv', 'case0']
+        settings = contourplot_xyplane.plotsettings
+    elif figure == 'lineplot_yaxis':
+        j = cases.index(case)
+        datasets = [case, 'piv'] if case == 'case0' else [case]
+        settings = dict(inset_xlim=lineplot_yaxis.inset_xlim[j],
+                        inset_ylim=lineplot_yaxis.inset_ylim[j],
+                        inset_kwargs=lineplot_yaxis.inset_kwargs[j])
+    else:
+        datasets = [case]
+        settings = sys.modules[figure].plotsettings
+    return fingerprints.compute([datapath(name) for name in datasets],
+                                settings, [sys.modules[figure].__file__])
+
+
+def render(case, figure):
+    """Create figure for case, where case 'piv' is the piv image sampled with
+    the xy-slice of case 0"""
+    ofile = figurepath(case, figure)
+
+    if case == 'piv':
+        contourplot_xyplane.contourplot(
+            contourplot_xyplane.samplepiv(readpiv(), getxyslice('case0')),
+            ofile=ofile, **contourplot_xyplane.plotsettings)
+
+    elif figure == 'contourplot_xyplane':
+        contourplot_xyplane.contourplot(
+            getxyslice(case), ofile=ofile,
+            **contourplot_xyplane.plotsettings)
+
+    elif figure == 'streamplot_xyplane':
+        streamplot_xyplane.streamplot(
+            readcfd(case), ofile=ofile, xyslice=getxyslice(case),
+            **streamplot_xyplane.plotsettings)
+
+    elif figure == 'contourplot_yzplane':
+        contourplot_yzplane.contourplot(
+            getyzslice(case), ofile=ofile,
+            **contourplot_yzplane.plotsettings)
+
+    elif figure == 'lineplot_yaxis':
+        j = cases.index(case)
+        lineplot_yaxis.lineplot(
+            readcfd(case), ofile=ofile,
+            inset_xlim=lineplot_yaxis.inset_xlim[j],
+            inset_ylim=lineplot_yaxis.inset_ylim[j],
+            inset_kwargs=lineplot_yaxis.inset_kwargs[j],
+            piv=readpiv() if case == 'case0' else None)
+
+    else:
+        raise ValueError('unknown figure ' + repr(figure))
+
+
+def renderunit(unit):
+    """Render work unit (case, figure); return traceback on failure"""
+    try:
+        with proflib.stage(unit[0], figure=unit[1]):
+            render(*unit)
+    except Exception:
+        return traceback.format_exc()
+    return None
+
+
+def workunits():
+    """List of (case, figure) work units, grouped by case"""
+    units = []
+    for case in cases:
+        units += [(case, figure) for figure in figures]
+        if case == 'case0':
+            units.append(('piv', 'contourplot_xyplane'))
+    return units
+
+
+#==============================================================================
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='number of worker processes (default: 1)')
+    proflib.addarguments(parser)
+    buildlib.addarguments(parser)
+    args = parser.parse_args()
+    proflib.enable(args.profile, args.cprofile)
+
+    # figures are only written to file, also by the worker processes
+    matplotlib.use('Agg')
+    os.environ.setdefault('SOURCE_DATE_EPOCH', '0')
+    for figure in figures:
+        path = os.path.join(root, 'figs', figure)
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    # skip work units whose figure is up to date
+    fingerprints = buildlib.Fingerprints(
+        os.path.join(root, 'figs', 'fingerprints.json'), force=args.force)
+    units = []
+    unitfingerprints = {}
+    for unit in workunits():
+        unitfingerprints[unit] = fingerprint(fingerprints, *unit)
+        if fingerprints.isuptodate(figurepath(*unit), unitfingerprints[unit]):
+            print(' '.join(unit) + ' (up to date)')
+        else:
+            units.append(unit)
+
+    failed = []
+
+    def done(unit, error):
+        """Report work unit and store its fingerprint if it succeeded"""
+        print(' '.join(unit) + (' failed' if error else ''))
+        if error:
+            failed.append((unit, error))
+        else:
+            fingerprints.update(figurepath(*unit), unitfingerprints[unit])
+
+    if args.jobs > 1 and units:
+        # publish cfd datasets of the work units; workers read unpublished
+        # ones themselves and report their errors per work unit
+        handles = {}
+        needed = {'case0' if case == 'piv' else case for case, _ in units}
+        try:
+            for case in cases:
+                if case not in needed:
+                    continue
+                try:
+                    handles[case] = iolib.publishgrid(loadcfd(case), fields)
+                except Exception as error:
+                    sys.stderr.write('{:s} not shared, workers read it '
+                                     'themselves: {!r}\n'.format(case, error))
+
+            with ProcessPoolExecutor(max_workers=args.jobs,
+                                     initializer=setsharedgrids,
+                                     initargs=(handles,)) as executor:
+                futures = {executor.submit(renderunit, unit): unit
+                           for unit in units}
+                for future in as_completed(futures):
+                    unit = futures[future]
+                    try:
+                        error = future.result()
+                    except Exception:
+                        error = traceback.format_exc()  # e.g. worker crashed
+                    done(unit, error)
+        finally:
+            for handle in handles.values():
+                iolib.releasegrid(handle)
+    else:
+        for unit in units:
+            done(unit, renderunit(unit))
+
+    for unit, error in failed:
+        sys.stderr.write('\n{:s} {:s} failed:\n{:s}'.format(*unit, error))
+    sys.exit(1 if failed else 0)
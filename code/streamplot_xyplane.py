@@ -1,173 +1,277 @@
-"""Contour plots with streamlines superimposed of the in-plane velocity
-(i.e. xy-velocity) on the xy-slice. The slices are obtained by slicing the CFD
-datasets (vtu format) with the xy-plane at z = 0 mm.
-
-"""
-
-import os
-import vtk
-import numpy as np
-import matplotlib.pyplot as plt
-from utils import iolib
-from utils import vtklib
-
-
-def streamplot(cfd, ofile='streamplot.pdf', zloc=0.0, xmin=0, xmax=1,
-               ymin=0, ymax=1, gridspacing=1.0, streamlinedensity=1,
-               hidelabels=False):
-    """Contour plot with streamlines superimposed on the xy-slice at z = zloc
-
-    Input: Unstructured grid with Vx_mm_s, Vy_mm_s and Vxy_mm_s pointdata
-    Output: Plot saved as PDF
-
-    To create the contourplot, the cfd dataset is sliced with the xy-plane at
-    z = zloc. From this slice we extract the x- and y-coordinates, vxy, and a
-    list with for each triangle the indices of the three points that make up the
-    triangle, ordered in anticlockwise manner.
-
-    To create the streamplot, the cfd dataset is probed with an evenly spaced
-    grid. The argument 'gridspacing' controls the resolution. Note that
-    undersampling might lead to non-zero vxy values outside the flow domain and,
-    thus, to streamlines running outside of it. The argument streamlinedensity
-    controls the closeness of streamlines. When streamlinedensity=1, the domain
-    is divided into a 25x25 grid; density linearly scales this grid.
-
-    In the paper, we also show plots of vxy vs. y along the y-axis. Therefore, a
-    line corresponding to the y-axis is added to the streamplot.
-
-    """
-
-    #==========================================================================
-    # Slice CFD dataset
-    #==========================================================================
-
-    # slice cfd dataset with xy-plane
-    xyslice = vtklib.slicedataset(cfd, [0, 0, zloc], [0, 0, 1])
-    xyslice = vtklib.triangulate(xyslice)
-    numberofcells = xyslice.GetNumberOfCells()
-    numberofpoints = xyslice.GetNumberOfPoints()
-
-    #==========================================================================
-    # Contour plot
-    #==========================================================================
-
-    # initialize figure
-    fig = plt.figure()
-    ax = fig.add_subplot(111)
-
-    # nparrays for x, y, vxy
-    x = np.empty(numberofpoints)
-    y = np.empty(numberofpoints)
-    vxy = np.empty(numberofpoints)
-    vxyarray = xyslice.GetPointData().GetArray('Vxy_mm_s')
-    for i in range(numberofpoints):
-        x[i] = xyslice.GetPoint(i)[0]
-        y[i] = xyslice.GetPoint(i)[1]
-        vxy[i] = vxyarray.GetValue(i)
-
-    # array defining pointids per triangle
-    triangles = np.empty(shape=(numberofcells, 3))
-    for i in range(numberofcells):
-        cellpointids = xyslice.GetCell(i).GetPointIds()
-        for j in range(cellpointids.GetNumberOfIds()):
-            triangles[i, j] = cellpointids.GetId(j)
-
-    # plot filled contours
-    cplot = ax.tricontourf(x, y, triangles, vxy,
-                           levels=np.linspace(0, 100, 101),
-                           cmap='RdBu_r', extend='both', zorder=-1)
-
-    #==========================================================================
-    # Stream plot
-    #==========================================================================
-
-    # evenly spaced grid
-    xgrid, ygrid = np.mgrid[xmin:xmax+gridspacing:gridspacing,
-                            ymin:ymax+gridspacing:gridspacing]
-    xsize, ysize = xgrid.shape
-
-    # convert evenly spaced grid to vtkPoints object
-    probepoints = vtk.vtkPoints()
-    probepoints.SetNumberOfPoints(xsize * ysize)
-    probepointid = 0
-    for i in range(xsize):
-        for j in range(ysize):
-            probepointx = xgrid[i, j]
-            probepointy = ygrid[i, j]
-            probepointz = zloc
-            probepoint = (probepointx, probepointy, probepointz)
-            probepoints.SetPoint(probepointid, probepoint)
-            probepointid += 1
-    probe = vtk.vtkPolyData()
-    probe.SetPoints(probepoints)
-
-    # probe the cfd result with evenly spaced grid
-    prober = vtk.vtkProbeFilter()
-    prober.SetInputData(probe)
-    prober.SetSourceData(cfd)
-    prober.Update()
-    xyslicegrid = prober.GetOutput()
-
-    # create nparrays for vx and vy with same shape as xgrid and ygrid
-    vxarray = xyslicegrid.GetPointData().GetArray('Vx_mm_s')
-    vyarray = xyslicegrid.GetPointData().GetArray('Vy_mm_s')
-    vx = np.empty(shape=(xsize, ysize))
-    vy = np.empty(shape=(xsize, ysize))
-    pointid = 0
-    for i in range(xsize):
-        for j in range(ysize):
-            vx[i, j] = vxarray.GetValue(pointid)
-            vy[i, j] = vyarray.GetValue(pointid)
-            pointid += 1
-
-    # streamline width is a function of vxy magnitude
-    speed = np.sqrt(vx*vx + vy*vy)
-    lw = 5 * speed / speed.max()
-
-    # plot streamlines; arrays need to be transposed
-    ax.streamplot(xgrid.T, ygrid.T, vx.T, vy.T, density=streamlinedensity,
-                  color='.5', linewidth=lw.T)
-
-    # draw y-axis
-    ax.axvline(0, ymin, ymax, color='w', ls='-', lw=2, zorder=10)
-
-    #==========================================================================
-    # Set plot properties and write plot
-    #==========================================================================
-
-    # set axes labels and ticks
-    ax.set_xlim(xmin, xmax)
-    ax.set_ylim(ymin, ymax)
-    ax.set_xlabel('x [mm]', fontsize=36)
-    ax.set_ylabel('y [mm]', fontsize=36)
-    plt.setp(ax.get_xticklabels(), fontsize=32)
-    plt.setp(ax.get_yticklabels(), fontsize=32)
-    if hidelabels:
-        # do not show axes labels and ticks
-        ax.get_xaxis().set_visible(False)
-        ax.get_yaxis().set_visible(False)
-
-    # write figure
-    ax.set_aspect('equal')
-    ax.set_rasterization_zorder(0)  # raster contourplot, vector rest
-    fig.savefig(ofile, bbox_inches="tight", dpi=200)
-    plt.close()
-
-
-#==============================================================================
-
-root = os.path.join(os.path.dirname(__file__), os.pardir)
-path = os.path.join(root, 'figs', 'streamplot_xyplane')
-if not os.path.exists(path):
-    os.makedirs(path)
-
-cases = ['case' + str(i).zfill(1) for i in range(6)]
-for case in cases:
-
-    print(case)
-
-    cfd = iolib.readvtu(os.path.join(root, 'data', 'cfd', case + '.vtu'))
-
-    streamplot(cfd, ofile=os.path.join(path, case + '.pdf'),
-               zloc=0, xmin=-6, xmax=6, ymin=-7, ymax=5,
-               gridspacing=0.005, streamlinedensity=2, hidelabels=True)
+"""Contour plots with streamlines superimposed of the in-plane velocity
+(i.e. xy-velocity) on the xy-slice. The slices are obtained by slicing the CFD
+datasets (vtu format) with the xy-plane at z = 0 mm.
+
+"""
+
+import os
+import argparse
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib.tri as mtri
+from matplotlib.collections import LineCollection
+from matplotlib.patches import FancyArrowPatch
+from utils import buildlib
+from utils import iolib
+from utils import lazyvtk as vtk
+from utils import numpylib
+from utils import plotlib
+from utils import proflib
+from utils import vtklib
+
+
+def probeslice(triangulation, values, xgrid, ygrid):
+    """Interpolate pointdata of a triangulated slice linearly on a grid
+
+    The grid points are located in the triangles of the slice (barycentric
+    lookup); grid points outside the slice are masked.
+
+    """
+    interpolator = mtri.LinearTriInterpolator(triangulation, values)
+    return interpolator(xgrid, ygrid)
+
+
+@proflib.profiled
+def streamplot(cfd, ofile='streamplot.pdf', zloc=0.0, xmin=0, xmax=1,
+               ymin=0, ymax=1, gridspacing=1.0, streamlinedensity=1,
+               probemode='slice', hidelabels=False, xyslice=None,
+               method='vtk', tolerance=None, targetcells=None):
+    """Contour plot with streamlines superimposed on the xy-slice at z = zloc
+
+    Input: Unstructured grid with Vx_mm_s, Vy_mm_s and Vxy_mm_s pointdata
+    Output: Plot saved as PDF
+
+    To create the contourplot, the cfd dataset is sliced with the xy-plane at
+    z = zloc. From this slice we extract the x- and y-coordinates, vxy, and a
+    list with for each triangle the indices of the three points that make up the
+    triangle, ordered in anticlockwise manner.
+
+    With method='vtk' (default), evenly spaced streamlines of the in-plane
+    velocity are traced directly on the part of the triangulated xy-slice
+    within the plot window (see vtklib.tracestreamlines), and drawn as line
+    segments whose width scales with vxy. The argument streamlinedensity
+    controls the closeness of streamlines: their separation is 1/25th of the
+    plot window divided by streamlinedensity.
+
+    With method='matplotlib', the velocity is sampled on an evenly spaced grid
+    for matplotlib's streamplot. The argument 'gridspacing' controls the
+    resolution. With probemode='slice' (default), the grid is interpolated on
+    the triangulated xy-slice and grid points outside the slice are masked, so
+    streamlines stop at the edge of the flow domain. With probemode='volume',
+    the full cfd dataset is probed. Note that undersampling might then lead to
+    non-zero vxy values outside the flow domain and, thus, to streamlines
+    running outside of it. The argument streamlinedensity controls the
+    closeness of streamlines. When streamlinedensity=1, the domain is divided
+    into a 25x25 grid; density linearly scales this grid.
+
+    If the xy-slice at z = zloc has already been computed, it can be passed as
+    xyslice to avoid slicing the cfd dataset again.
+
+    For the contour plot only, the triangulated xy-slice is simplified if
+    tolerance (in mm, e.g. the pixel size) or targetcells is given (see
+    vtklib.simplify). The streamlines are computed on the full xy-slice. The
+    meshes of the xy-slice are cached and shared with other plots of the slice
+    (see plotlib.getslicemesh).
+
+    In the paper, we also show plots of vxy vs. y along the y-axis. Therefore, a
+    line corresponding to the y-axis is added to the streamplot.
+
+    """
+
+    #==========================================================================
+    # Slice CFD dataset
+    #==========================================================================
+
+    # slice cfd dataset with xy-plane
+    if xyslice is None:
+        xyslice = vtklib.slicedataset(cfd, [0, 0, zloc], [0, 0, 1])
+
+    #==========================================================================
+    # Contour plot
+    #==========================================================================
+
+    # initialize figure
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+
+    # simplified mesh of xy-slice, shared with other plots of the slice
+    mesh = plotlib.getslicemesh(xyslice, (0, 1), tolerance, targetcells)
+
+    # plot filled contours
+    with proflib.stage('tricontourf'):
+        cplot = ax.tricontourf(mesh.triangulation, mesh.fields['Vxy_mm_s'],
+                               levels=np.linspace(0, 100, 101),
+                               cmap='RdBu_r', extend='both', zorder=-1)
+
+    #==========================================================================
+    # Stream plot
+    #==========================================================================
+
+    if method == 'vtk':
+        # part of the xy-slice within the plot window, with velocity vectors
+        window = vtklib.extractbox(vtklib.triangulate(xyslice),
+                                   [xmin, xmax, ymin, ymax,
+                                    zloc - 1, zloc + 1])
+        vx = numpylib.getpointarray(window, 'Vx_mm_s')
+        vy = numpylib.getpointarray(window, 'Vy_mm_s')
+        speed = np.sqrt(vx*vx + vy*vy)
+        window.GetPointData().AddArray(numpylib.makearray(
+            np.column_stack((vx, vy, np.zeros_like(vx))), 'Vxy_vector'))
+
+        # no streamlines if there is no flow within the plot window
+        if speed.size > 0 and speed.max() > 0:
+            # trace streamlines, starting where the flow is fastest
+            separatingdistance = (min(xmax - xmin, ymax - ymin) /
+                                  (25. * streamlinedensity))
+            streamlines = vtklib.tracestreamlines(
+                window, 'Vxy_vector',
+                numpylib.getpoints(window)[speed.argmax()],
+                separatingdistance)
+
+            # line segments between consecutive points of each streamline,
+            # with width a function of vxy magnitude
+            linepoints = numpylib.getpoints(streamlines)[:, :2]
+            linevectors = numpylib.getpointarray(streamlines, 'Vxy_vector')
+            linespeed = np.sqrt((linevectors[:, :2]**2).sum(axis=1))
+            connectivity, offsets = numpylib.getcellarray(
+                streamlines.GetLines())
+            inner = np.ones(max(connectivity.size - 1, 0), dtype=bool)
+            inner[offsets[1:-1] - 1] = False  # skip from one line to the next
+            start = connectivity[:-1][inner]
+            end = connectivity[1:][inner]
+            lw = 5 * (linespeed[start] + linespeed[end]) / (2 * speed.max())
+            ax.add_collection(LineCollection(
+                np.stack((linepoints[start], linepoints[end]), axis=1),
+                colors='.5', linewidths=lw))
+
+            # arrow halfway along each streamline, in the flow direction,
+            # except on stubs shorter than about two separating distances (10
+            # steps)
+            for first, last in zip(offsets[:-1], offsets[1:]):
+                pointid = connectivity[(first + last) // 2]
+                if last - first < 10 or linespeed[pointid] == 0:
+                    continue
+                direction = linevectors[pointid, :2] / linespeed[pointid]
+                ax.add_patch(FancyArrowPatch(
+                    linepoints[pointid],
+                    linepoints[pointid] + direction * separatingdistance / 5,
+                    arrowstyle='-|>', mutation_scale=10, shrinkA=0, shrinkB=0,
+                    color='.5', lw=5 * linespeed[pointid] / speed.max()))
+
+    elif method == 'matplotlib':
+        # evenly spaced grid
+        xgrid, ygrid = np.mgrid[xmin:xmax+gridspacing:gridspacing,
+                                ymin:ymax+gridspacing:gridspacing]
+        xsize, ysize = xgrid.shape
+
+        if probemode == 'slice':
+            # interpolate vx and vy on the triangulated xy-slice, sharing
+            # the triangulation with the contour plot if it is not simplified
+            mesh = plotlib.getslicemesh(xyslice)
+            vx = probeslice(mesh.triangulation, mesh.fields['Vx_mm_s'],
+                            xgrid, ygrid)
+            vy = probeslice(mesh.triangulation, mesh.fields['Vy_mm_s'],
+                            xgrid, ygrid)
+        elif probemode == 'volume':
+            # convert evenly spaced grid to vtkPoints in one contiguous buffer
+            probepoints = numpylib.makepoints(
+                np.column_stack((xgrid.ravel(), ygrid.ravel(),
+                                 np.full(xgrid.size, zloc))))
+            probe = vtk.vtkPolyData()
+            probe.SetPoints(probepoints)
+
+            # probe the cfd result with evenly spaced grid
+            xyslicegrid = vtklib.probedataset(cfd, probe)
+
+            # create nparrays for vx and vy with same shape as xgrid and ygrid
+            vx = numpylib.getpointarray(xyslicegrid, 'Vx_mm_s')
+            vy = numpylib.getpointarray(xyslicegrid, 'Vy_mm_s')
+            vx = vx.reshape(xsize, ysize)
+            vy = vy.reshape(xsize, ysize)
+        else:
+            raise ValueError('unknown probemode ' + repr(probemode))
+
+        # streamline width is a function of vxy magnitude; no streamlines if
+        # there is no flow on the grid
+        speed = np.sqrt(vx*vx + vy*vy)
+        if np.ma.filled(speed, 0).max() > 0:
+            lw = np.ma.filled(5 * speed / speed.max(), 0)
+
+            # plot streamlines; arrays need to be transposed
+            ax.streamplot(xgrid.T, ygrid.T, vx.T, vy.T,
+                          density=streamlinedensity, color='.5',
+                          linewidth=lw.T)
+
+    else:
+        raise ValueError('unknown method ' + repr(method))
+
+    # draw y-axis
+    ax.axvline(0, ymin, ymax, color='w', ls='-', lw=2, zorder=10)
+
+    #==========================================================================
+    # Set plot properties and write plot
+    #==========================================================================
+
+    # set axes labels and ticks
+    ax.set_xlim(xmin, xmax)
+    ax.set_ylim(ymin, ymax)
+    ax.set_xlabel('x [mm]', fontsize=36)
+    ax.set_ylabel('y [mm]', fontsize=36)
+    plt.setp(ax.get_xticklabels(), fontsize=32)
+    plt.setp(ax.get_yticklabels(), fontsize=32)
+    if hidelabels:
+        # do not show axes labels and ticks
+        ax.get_xaxis().set_visible(False)
+        ax.get_yaxis().set_visible(False)
+
+    # write figure
+    ax.set_aspect('equal')
+    ax.set_rasterization_zorder(0)  # raster contourplot, vector rest
+    with proflib.stage('savefig') as savefig:
+        fig.savefig(ofile, bbox_inches="tight", dpi=200)
+        savefig.setoutput(ofile)
+    plt.close()
+
+
+#==============================================================================
+
+# plot window, resolution, labels and simplification tolerance (about a pixel),
+# shared with make_figures.py
+plotsettings = dict(zloc=0, xmin=-6, xmax=6, ymin=-7, ymax=5,
+                    gridspacing=0.005, streamlinedensity=2, hidelabels=True,
+                    tolerance=0.01)
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    proflib.addarguments(parser)
+    buildlib.addarguments(parser)
+    args = parser.parse_args()
+    proflib.enable(args.profile, args.cprofile)
+
+    root = os.path.join(os.path.dirname(__file__), os.pardir)
+    fingerprints = buildlib.Fingerprints(
+        os.path.join(root, 'figs', 'fingerprints.json'), force=args.force)
+    path = os.path.join(root, 'figs', 'streamplot_xyplane')
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    cases = ['case' + str(i).zfill(1) for i in range(6)]
+    for case in cases:
+
+        # skip figure if its data, settings and code did not change
+        ofile = os.path.join(path, case + '.pdf')
+        vtufile = os.path.join(root, 'data', 'cfd', case + '.vtu')
+        fingerprint = fingerprints.compute([vtufile], plotsettings,
+                                           [__file__])
+        if fingerprints.isuptodate(ofile, fingerprint):
+            print(case + ' (up to date)')
+            continue
+
+        print(case)
+
+        with proflib.stage(case):
+            cfd = iolib.readvtu(vtufile)
+
+            streamplot(cfd, ofile=ofile, **plotsettings)
+        fingerprints.update(ofile, fingerprint)
@@ -0,0 +1,208 @@
+import ast
+import contextlib
+import hashlib
+import json
+import os
+import sys
+from . import iolib
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+def addarguments(parser):
+    """Add --force option to argparse parser, to be passed to Fingerprints"""
+    parser.add_argument('--force', action='store_true',
+                        help='rebuild all figures, even if they are up to '
+                             'date')
+
+
+def _utilsimports(path):
+    """Return paths of the utils modules imported by the source file at path,
+    read from its import statements, including those inside functions"""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    inutils = os.path.dirname(os.path.abspath(path)) == directory
+    with open(path, 'rb') as ifile:
+        tree = ast.parse(ifile.read(), path)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[1] for alias in node.names
+                         if alias.name.startswith('utils.'))
+        elif isinstance(node, ast.ImportFrom):
+            if node.level == 0 and node.module == 'utils' or (
+                    node.level == 1 and inutils and node.module is None):
+                names.update(alias.name for alias in node.names)
+            elif node.level == 0 and node.module.startswith('utils.'):
+                names.add(node.module.split('.')[1])
+            elif node.level == 1 and inutils:
+                names.add(node.module.split('.')[0])
+    paths = [os.path.join(directory, name + '.py') for name in names]
+    return [path for path in paths if os.path.exists(path)]
+
+
+def _versions():
+    """Return versions of the packages that create the figures"""
+    import matplotlib
+    import numpy
+    from . import lazyvtk as vtk
+    return dict(matplotlib=matplotlib.__version__, numpy=numpy.__version__,
+                vtk=vtk.vtkVersion.GetVTKVersion(),
+                python=sys.version.split()[0])
+
+
+class Fingerprints(object):
+    """Fingerprints of figures, to rebuild only figures that are out of date
+
+    The fingerprint of a figure is the SHA-256 of the contents of its input
+    files, its parameters, the source code of the script that creates it and
+    of the utils modules that the script imports, directly or through other
+    utils modules, and the versions of python, matplotlib, numpy and
+    VTK. A figure is up to date if it exists and its fingerprint equals the
+    one stored when it was last built.
+
+    The fingerprints are stored by figure path in a JSON-file, e.g.
+    figs/fingerprints.json, along with the size, mtime and SHA-256 of each
+    input file, like the manifest of download_data.py, so that input files
+    are only hashed again when they change. With force, no figure is up to
+    date. Since the fingerprint does not depend on how a figure is created,
+    the plot scripts and make_figures.py share the fingerprints, also when
+    they run at the same time: each write merges the fingerprints updated by
+    this object into the current file.
+
+    """
+
+    def __init__(self, path, force=False):
+        self.path = path
+        self.force = force
+        self.figures, self.files = self._read()
+        self._updated = {}  # fingerprints of the figures built, by key
+        self._sources = {}
+        self._imports = {}
+        self._versions = None
+
+    def _read(self):
+        """Return figures and files stored in the JSON-file"""
+        stored = {}
+        if os.path.exists(self.path):
+            with open(self.path) as ifile:
+                stored = json.load(ifile)
+        return stored.get('figures', {}), stored.get('files', {})
+
+    @contextlib.contextmanager
+    def _lock(self):
+        """Lock the JSON-file against other processes (where fcntl is
+        available)"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + '.lock', 'a') as lockfile:
+            fcntl.flock(lockfile, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+    def _key(self, path):
+        """Path relative to the directory of the JSON-file, with '/'"""
+        return os.path.relpath(path, os.path.dirname(self.path)).replace(
+            os.sep, '/')
+
+    def _hashfile(self, path):
+        """Return SHA-256 of file at path, computed again only if its size or
+        mtime changed"""
+        key = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = self.files.get(key)
+        if (entry is None or entry['size'] != stat.st_size or
+                entry['mtime'] != stat.st_mtime):
+            entry = self.files[key] = iolib.fileentry(path)
+        return entry['sha256']
+
+    def _hashsource(self, path):
+        """Return SHA-256 of source file at path, read once per run"""
+        if path not in self._sources:
+            with open(path, 'rb') as ifile:
+                self._sources[path] = hashlib.sha256(ifile.read()).hexdigest()
+        return self._sources[path]
+
+    def _importedutils(self, sources):
+        """Return sorted paths of the utils modules that the source files
+        import, directly or through other utils modules"""
+        imported = set()
+        stack = list(sources)
+        while stack:
+            path = stack.pop()
+            if path not in self._imports:
+                self._imports[path] = _utilsimports(path)
+            for module in self._imports[path]:
+                if module not in imported:
+                    imported.add(module)
+                    stack.append(module)
+        return sorted(imported)
+
+    def compute(self, files=(), parameters={}, sources=()):
+        """Return fingerprint of a figure with input files (or directories of
+        input files), parameters, a dict of JSON-serializable values, and
+        source files of the scripts that create it. The utils modules that
+        the sources import are included as sources. As when reading the
+        datasets, a file path + '.gz' is used if only that exists. Missing
+        files count as changed, so that the figure is built and reports the
+        error."""
+        sha256 = hashlib.sha256()
+        paths = []
+        for path in files:
+            if not os.path.exists(path) and os.path.exists(path + '.gz'):
+                path += '.gz'
+            if os.path.isdir(path):
+                paths += [os.path.join(path, name)
+                          for name in sorted(os.listdir(path))]
+            else:
+                paths.append(path)
+        for path in paths:
+            digest = self._hashfile(path) if os.path.exists(path) else None
+            sha256.update('file {:s} {}\n'.format(os.path.basename(path),
+                                                  digest).encode())
+
+        sha256.update('parameters {:s}\n'.format(
+            json.dumps(parameters, sort_keys=True, default=repr)).encode())
+
+        for path in list(sources) + self._importedutils(sources):
+            sha256.update('source {:s} {:s}\n'.format(
+                os.path.basename(path), self._hashsource(path)).encode())
+
+        if self._versions is None:
+            self._versions = json.dumps(_versions(), sort_keys=True)
+        sha256.update('versions {:s}\n'.format(self._versions).encode())
+        return sha256.hexdigest()
+
+    def isuptodate(self, figure, fingerprint):
+        """Return whether file figure exists and was built with fingerprint"""
+        return (not self.force and os.path.exists(figure) and
+                self.figures.get(self._key(figure)) == fingerprint)
+
+    def update(self, figure, fingerprint):
+        """Store fingerprint of file figure after building it"""
+        self.figures[self._key(figure)] = fingerprint
+        self._updated[self._key(figure)] = fingerprint
+        self.write()
+
+    def write(self):
+        """Write fingerprints to the JSON-file, replacing it only when
+        complete. Under a lock, the file is read again and the fingerprints
+        updated by this object are merged into it, so that those written by
+        other processes in the meantime are kept."""
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with self._lock():
+            figures, files = self._read()
+            figures.update(self._updated)
+            files.update(self.files)
+            with open(self.path + '.tmp', 'w') as ofile:
+                json.dump(dict(figures=figures, files=files), ofile,
+                          indent=2, sort_keys=True)
+            os.replace(self.path + '.tmp', self.path)
+        self.figures, self.files = figures, files
@@ -1,71 +1,503 @@
-import vtk
-from urllib.request import urlopen
-import zlib
-import sys
-
-
-def download_data(url, destination, decompress=False, chunksize=(16*1024)):
-    """Download file from url to destination
-
-    The file is read and written in chunks of chunksize to avoid overloading
-    computer memory. Progress status is printed for each chunk.
-
-    For files compressed with gzip, we use zlib to decompress the chunks
-    as they are streaming in.
-
-    """
-    # open url and extract file size
-    response = urlopen(url)
-    file_size = int(response.getheader('Content-Length'))
-
-    if decompress:
-        # create decompression object for decompressing data streams
-        decompression_object = zlib.decompressobj(16 + zlib.MAX_WBITS)
-
-    file_size_dl = 0
-    with open(destination, 'wb') as ofile:
-        while True:
-
-            # read data chunk, break when end of file is reached
-            chunk = response.read(chunksize)
-            if not chunk: break
-
-            # write (decompressed) data chunk
-            if decompress:
-                chunk_decompressed = decompression_object.decompress(chunk)
-                ofile.write(chunk_decompressed)
-                chunk_decompressed = decompression_object.flush()
-            else:
-                ofile.write(chunk)
-
-            # variables for print progress status
-            file_size_dl += len(chunk)  # amount already downloaded
-            file_name = url.split('/')[-1]
-            bytes_per_MB = 1024.**2
-            operation = 'Downloading '
-            if decompress: operation += 'and decompressing '
-
-            # print progress status
-            status = (operation + '{:s}     '.format(file_name) +
-                      '{:.1f} / '.format(file_size_dl / bytes_per_MB) +
-                      '{:.1f} MB '.format(file_size / bytes_per_MB) +
-                      '[{:.1f}%]'.format(file_size_dl * 100. / file_size) +
-                      1000 * chr(8))  # hack to erase previous line
-            sys.stdout.write(status)
-        sys.stdout.write('\n')
-
-
-def readvti(path):
-    """Read VTI-files, i.e. images in VTK XML format."""
-    reader = vtk.vtkXMLImageDataReader()
-    reader.SetFileName(path)
-    reader.Update()
-    return reader.GetOutput()
-
-
-def readvtu(path):
-    """Read VTU-files, i.e. unstructured grids in VTK XML format."""
-    reader = vtk.vtkXMLUnstructuredGridReader()
-    reader.SetFileName(path)
-    reader.Update()
-    return reader.GetOutput()
+from urllib.request import urlopen, Request
+from urllib.error import HTTPError
+from http.client import HTTPException
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+import gzip
+import os
+import hashlib
+import json
+import threading
+import time
+import zlib
+import sys
+import numpy as np
+from . import lazyvtk as vtk
+from . import numpylib
+from . import proflib
+
+
+# Shared memory blocks published or attached by this process, by name (see
+# publishgrid and attachgrid).
+_sharedmemory = {}
+
+
+class DownloadProgress(object):
+    """Progress status of one or more concurrent downloads
+
+    The status line is written at most once per interval seconds, and when a
+    file completes.
+
+    """
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.files = {}  # file name: (bytes downloaded, file size or None)
+        self.lastwrite = 0.
+
+    def update(self, name, done, total):
+        with self.lock:
+            self.files[name] = (done, total)
+            now = time.time()
+            if now - self.lastwrite < self.interval and done != total:
+                return
+            self.lastwrite = now
+
+            # variables for print progress status
+            bytes_per_MB = 1024.**2
+            dl = sum(done for done, total in self.files.values())
+            size = sum(total or done for done, total in self.files.values())
+            if len(self.files) == 1:
+                operation = 'Downloading {:s}     '.format(name)
+            else:
+                operation = 'Downloading {:d} files     '.format(
+                    len(self.files))
+
+            # print progress status
+            status = (operation +
+                      '{:.1f} / '.format(dl / bytes_per_MB) +
+                      '{:.1f} MB '.format(size / bytes_per_MB) +
+                      '[{:.1f}%]'.format(dl * 100. / max(size, 1)) +
+                      1000 * chr(8))  # hack to erase previous line
+            sys.stdout.write(status)
+            sys.stdout.flush()
+
+    def finish(self):
+        sys.stdout.write('\n')
+
+
+def _fetch(url, partial, chunksize, maxchunksize, progress):
+    """Download url to file partial, resuming from its current size"""
+    name = url.split('/')[-1]
+    offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+
+    # request the part of the file that is still missing
+    request = Request(url)
+    if offset:
+        request.add_header('Range', 'bytes={:d}-'.format(offset))
+    try:
+        response = urlopen(request, timeout=60)
+    except HTTPError as error:
+        if offset and error.code == 416:
+            # range not satisfiable: partial is complete if its size matches
+            contentrange = error.headers.get('Content-Range', '')
+            if contentrange.endswith('/' + str(offset)):
+                return
+            os.remove(partial)
+            return _fetch(url, partial, chunksize, maxchunksize, progress)
+        raise
+
+    with response:
+        if offset and response.status != 206:
+            offset = 0  # server ignored range request; start from scratch
+        length = response.getheader('Content-Length')
+        total = offset + int(length) if length is not None else None
+
+        file_size_dl = offset
+        with open(partial, 'ab' if offset else 'wb') as ofile:
+            while True:
+
+                # read data chunk, break when end of file is reached
+                start = time.time()
+                chunk = response.read(chunksize)
+                if not chunk: break
+                ofile.write(chunk)
+                file_size_dl += len(chunk)
+                progress.update(name, file_size_dl, total)
+
+                # grow chunks while they arrive faster than 0.1 s
+                if time.time() - start < 0.1:
+                    chunksize = min(2 * chunksize, maxchunksize)
+
+    if total is not None and file_size_dl < total:
+        raise HTTPException('connection closed after {:d} of {:d} bytes'
+                            .format(file_size_dl, total))
+
+
+def download_data(url, destination, decompress=False, chunksize=(16*1024),
+                  maxchunksize=(4*1024**2), retries=5, progress=None):
+    """Download file from url to destination
+
+    The file is downloaded in chunks to destination + '.part' and moved to
+    destination when complete. The chunk size starts at chunksize and doubles,
+    up to maxchunksize, while chunks keep arriving quickly. An interrupted
+    download is retried up to retries times. Each retry, and each later call,
+    resumes from the end of the partial file with an HTTP Range request.
+    Progress status is printed to a DownloadProgress object, which is created
+    if not given.
+
+    For files compressed with gzip, we use zlib to decompress the completed
+    download in chunks into destination + '.tmp', which is moved to
+    destination when complete. If the download cannot be decompressed, both
+    files are removed, so that the next call downloads it again.
+
+    """
+    finish = progress is None
+    if progress is None:
+        progress = DownloadProgress()
+
+    partial = destination + '.part'
+    for attempt in range(retries + 1):
+        try:
+            _fetch(url, partial, chunksize, maxchunksize, progress)
+            break
+        except (OSError, HTTPException) as error:
+            # client errors, e.g. file not found, are not worth a retry
+            if isinstance(error, HTTPError) and error.code < 500:
+                raise
+            if attempt == retries:
+                raise
+            time.sleep(min(2 ** attempt, 30))
+
+    if decompress:
+        # create decompression object for decompressing data streams
+        decompression_object = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        temporary = destination + '.tmp'
+        try:
+            with open(partial, 'rb') as ifile, \
+                    open(temporary, 'wb') as ofile:
+                while True:
+                    chunk = ifile.read(maxchunksize)
+                    if not chunk: break
+                    ofile.write(decompression_object.decompress(chunk))
+                ofile.write(decompression_object.flush())
+        except zlib.error:
+            for path in [temporary, partial]:
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+        os.replace(temporary, destination)
+        os.remove(partial)
+    else:
+        os.replace(partial, destination)
+
+    if finish:
+        progress.finish()
+
+
+def download_files(downloads, workers=4, completed=None, **kwargs):
+    """Download files concurrently with at most workers at a time
+
+    Args:
+        downloads: List of (url, destination, decompress) tuples.
+        workers: Maximum number of concurrent downloads.
+        completed: List to append the destination of each download to once it
+            finished without error, also if other downloads fail.
+        kwargs: Passed on to download_data.
+
+    """
+    def download(url, destination, decompress):
+        download_data(url, destination, decompress, progress=progress,
+                      **kwargs)
+        if completed is not None:
+            completed.append(destination)
+
+    progress = DownloadProgress()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(download, url, destination, decompress)
+                   for url, destination, decompress in downloads]
+        try:
+            for future in futures:
+                future.result()
+        finally:
+            progress.finish()
+
+
+def sha256sum(path, chunksize=(4*1024**2)):
+    """Return SHA-256 hex digest of file at path"""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as ifile:
+        while True:
+            chunk = ifile.read(chunksize)
+            if not chunk: break
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def fileentry(path):
+    """Return manifest entry, i.e. size, mtime and SHA-256, of file at path"""
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime,
+            'sha256': sha256sum(path)}
+
+
+def readmanifest(path):
+    """Read manifest from JSON file; empty if the file does not exist"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as ifile:
+        return json.load(ifile)
+
+
+def writemanifest(path, manifest):
+    """Write manifest to JSON file, replacing it only when complete"""
+    with open(path + '.tmp', 'w') as ofile:
+        json.dump(manifest, ofile, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def verifyfile(path, entry, quick=False):
+    """Verify file at path against its manifest entry
+
+    Returns 'ok', 'missing' or 'corrupt'. If quick, a file with the size and
+    mtime of the entry is accepted without computing its SHA-256.
+
+    """
+    if not os.path.exists(path):
+        return 'missing'
+    stat = os.stat(path)
+    if stat.st_size != entry['size']:
+        return 'corrupt'
+    if quick and stat.st_mtime == entry['mtime']:
+        return 'ok'
+    return 'ok' if sha256sum(path) == entry['sha256'] else 'corrupt'
+
+
+def verifyfiles(directory, manifest, names, quick=False, workers=4):
+    """Verify files names, relative to directory, against manifest
+
+    Files are hashed concurrently by at most workers threads. Returns dict
+    with for each name 'ok', 'missing', 'corrupt' or, if name exists but is
+    not in the manifest, 'unknown'.
+
+    """
+    def verify(name):
+        if name not in manifest:
+            if os.path.exists(os.path.join(directory, name)):
+                return 'unknown'
+            return 'missing'
+        return verifyfile(os.path.join(directory, name), manifest[name],
+                          quick)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(names, executor.map(verify, names)))
+
+
+def _readxml(reader, path):
+    """Read VTK XML file at path with reader
+
+    Files compressed with gzip, i.e. path ends with '.gz' or only path + '.gz'
+    exists, are decompressed while reading and passed to the reader as input
+    string, so the decompressed file is never written to disk.
+
+    """
+    if not os.path.exists(path) and os.path.exists(path + '.gz'):
+        path += '.gz'
+    if path.endswith('.gz'):
+        with gzip.open(path, 'rb') as ifile:
+            reader.ReadFromInputStringOn()
+            reader.SetInputString(ifile.read())
+    else:
+        reader.SetFileName(path)
+    reader.Update()
+    return reader.GetOutput()
+
+
+@proflib.profiled
+def readvti(path):
+    """Read VTI-files, i.e. images in VTK XML format, optionally gzipped."""
+    return _readxml(vtk.vtkXMLImageDataReader(), path)
+
+
+@proflib.profiled
+def readvtu(path):
+    """Read VTU-files, i.e. unstructured grids in VTK XML format, optionally
+    gzipped."""
+    return _readxml(vtk.vtkXMLUnstructuredGridReader(), path)
+
+
+@proflib.profiled
+def readvtp(path):
+    """Read VTP-files, i.e. polydata in VTK XML format, optionally gzipped."""
+    return _readxml(vtk.vtkXMLPolyDataReader(), path)
+
+
+def _writexml(writer, dataset, path):
+    """Write dataset to VTK XML file at path with writer, replacing path only
+    when complete."""
+    writer.SetInputData(dataset)
+    writer.SetFileName(path + '.tmp')
+    writer.Write()
+    os.replace(path + '.tmp', path)
+
+
+@proflib.profiled
+def writevti(image, path):
+    """Write image to VTI-file, replacing path only when complete."""
+    _writexml(vtk.vtkXMLImageDataWriter(), image, path)
+
+
+@proflib.profiled
+def writevtu(grid, path):
+    """Write unstructured grid to VTU-file, replacing path only when
+    complete."""
+    _writexml(vtk.vtkXMLUnstructuredGridWriter(), grid, path)
+
+
+@proflib.profiled
+def writevtp(polydata, path):
+    """Write polydata to VTP-file, replacing path only when complete."""
+    _writexml(vtk.vtkXMLPolyDataWriter(), polydata, path)
+
+
+@proflib.profiled
+def writecache(dataset, directory, fields=None):
+    """Write unstructured grid or image to a binary cache directory
+
+    The points, cell connectivity, offsets and types of a grid, or the origin,
+    spacing and extent of an image, and the point data arrays listed in fields
+    (default: all) are each written to a separate npy-file, so that they can be
+    memory-mapped and loaded selectively by readcache.
+
+    """
+    fieldpath = os.path.join(directory, 'fields')
+    if not os.path.exists(fieldpath):
+        os.makedirs(fieldpath)
+    if isinstance(dataset, vtk.vtkImageData):
+        np.save(os.path.join(directory, 'image.npy'),
+                np.concatenate((dataset.GetOrigin(), dataset.GetSpacing(),
+                                dataset.GetExtent())))
+    else:
+        connectivity, offsets, celltypes = numpylib.getcells(dataset)
+        np.save(os.path.join(directory, 'points.npy'),
+                numpylib.getpoints(dataset))
+        np.save(os.path.join(directory, 'connectivity.npy'), connectivity)
+        np.save(os.path.join(directory, 'offsets.npy'), offsets)
+        np.save(os.path.join(directory, 'celltypes.npy'), celltypes)
+    if fields is None:
+        pointdata = dataset.GetPointData()
+        fields = [pointdata.GetArrayName(i)
+                  for i in range(pointdata.GetNumberOfArrays())]
+    for name in fields:
+        np.save(os.path.join(fieldpath, name + '.npy'),
+                numpylib.getpointarray(dataset, name))
+
+
+@proflib.profiled
+def readcache(directory, fields=None):
+    """Read unstructured grid or image from a binary cache directory written by
+    writecache. Only the point data arrays listed in fields (default: all) are
+    loaded. The arrays are memory-mapped copy-on-write, so data is read from
+    disk only when it is accessed and the cache files are never modified."""
+    def load(name):
+        return np.load(os.path.join(directory, name + '.npy'), mmap_mode='c')
+
+    if fields is None:
+        fields = sorted(os.path.splitext(name)[0] for name in
+                        os.listdir(os.path.join(directory, 'fields')))
+    pointarrays = dict((name, load(os.path.join('fields', name)))
+                       for name in fields)
+    if os.path.exists(os.path.join(directory, 'image.npy')):
+        image = np.load(os.path.join(directory, 'image.npy'))
+        return numpylib.makeimagedata(image[0:3], image[3:6],
+                                      image[6:12].astype(int).tolist(),
+                                      pointarrays)
+    return numpylib.makeunstructuredgrid(
+        load('points'), load('connectivity'), load('offsets'),
+        load('celltypes'), pointarrays)
+
+
+def readcached(path, cache, fields=None):
+    """Read dataset from binary cache directory cache if it exists (see
+    writecache), with only the point data arrays listed in fields, else from
+    the VTI- or VTU-file path."""
+    if os.path.isdir(cache):
+        return readcache(cache, fields=fields)
+    if path.endswith(('.vti', '.vti.gz')):
+        return readvti(path)
+    return readvtu(path)
+
+
+def _sharearray(array):
+    """Copy nparray to a new shared memory block and return its handle."""
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    _sharedmemory[block.name] = block
+    handle = (block.name, array.dtype.str, array.shape)
+    try:
+        np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+    except BaseException:
+        _releasearrays([handle])
+        raise
+    return handle
+
+
+def _attacharray(handle):
+    """Return nparray view of the shared memory block of handle."""
+    name, dtype, shape = handle
+    block = _sharedmemory.get(name)
+    if block is None:
+        block = shared_memory.SharedMemory(name=name)
+        _sharedmemory[name] = block
+    return np.ndarray(shape, dtype, buffer=block.buf)
+
+
+def _releasearrays(handles):
+    """Close the shared memory blocks of handles and unlink them."""
+    for name, dtype, shape in handles:
+        block = _sharedmemory.pop(name)
+        block.close()
+        block.unlink()
+
+
+@proflib.profiled
+def publishgrid(grid, fields=None):
+    """Publish unstructured grid in shared memory
+
+    The points, cell connectivity, offsets and types, and the point data arrays
+    listed in fields (default: all) are copied to shared memory blocks. Returns
+    a small handle of block names, dtypes and shapes, which can be passed to
+    other processes to rebuild the grid with attachgrid without copying or
+    parsing. The attaching processes must be started by this process, e.g. as
+    a process pool, so that they share its resource tracker and leave the
+    blocks in place when they exit. Call releasegrid when all processes are
+    done with the grid. If publishing fails, e.g. because the shared memory is
+    full, the blocks created so far are released before the error is raised.
+
+    """
+    def share(array):
+        handle = _sharearray(array)
+        created.append(handle)
+        return handle
+
+    created = []
+    try:
+        connectivity, offsets, celltypes = numpylib.getcells(grid)
+        if fields is None:
+            pointdata = grid.GetPointData()
+            fields = [pointdata.GetArrayName(i)
+                      for i in range(pointdata.GetNumberOfArrays())]
+        return dict(
+            points=share(numpylib.getpoints(grid)),
+            connectivity=share(connectivity.astype(numpylib.IDTYPE)),
+            offsets=share(offsets.astype(numpylib.IDTYPE)),
+            celltypes=share(celltypes),
+            fields=dict((name, share(numpylib.getpointarray(grid, name)))
+                        for name in fields))
+    except BaseException:
+        _releasearrays(created)
+        raise
+
+
+@proflib.profiled
+def attachgrid(handle, fields=None):
+    """Rebuild unstructured grid published with publishgrid, from its handle.
+    Only the point data arrays listed in fields (default: all published) are
+    attached. The grid references the shared memory without copying it."""
+    if fields is None:
+        fields = list(handle['fields'])
+    return numpylib.makeunstructuredgrid(
+        _attacharray(handle['points']),
+        _attacharray(handle['connectivity']),
+        _attacharray(handle['offsets']),
+        _attacharray(handle['celltypes']),
+        dict((name, _attacharray(handle['fields'][name])) for name in fields))
+
+
+def releasegrid(handle):
+    """Close the shared memory blocks of a grid published with publishgrid in
+    this process, and unlink them. Grids attached in this process must no
+    longer be used."""
+    _releasearrays([handle['points'], handle['connectivity'],
+                    handle['offsets'], handle['celltypes']] +
+                   list(handle['fields'].values()))
@@ -0,0 +1,62 @@
+"""Lazy stand-in for the vtk package, to be imported as
+
+    from utils import lazyvtk as vtk
+
+Importing vtk loads all of VTK's modules, which takes most of the startup time
+of the scripts. This module instead provides the VTK classes and constants
+used by the scripts and utils, importing only the vtkmodules module that
+defines each of them, on first use. A class that is not listed in MODULES
+must be added there.
+
+"""
+
+import importlib
+
+
+# vtkmodules module of each VTK class and constant used, by name
+MODULES = {
+    'VTK_UNSIGNED_CHAR': 'vtkCommonCore',
+    'vtkIdTypeArray': 'vtkCommonCore',
+    'vtkPoints': 'vtkCommonCore',
+    'vtkVersion': 'vtkCommonCore',
+    'vtkBox': 'vtkCommonDataModel',
+    'vtkCellArray': 'vtkCommonDataModel',
+    'vtkCellLocatorStrategy': 'vtkCommonDataModel',
+    'vtkDataObject': 'vtkCommonDataModel',
+    'vtkImageData': 'vtkCommonDataModel',
+    'vtkPlane': 'vtkCommonDataModel',
+    'vtkPolyData': 'vtkCommonDataModel',
+    'vtkStaticCellLocator': 'vtkCommonDataModel',
+    'vtkUnstructuredGrid': 'vtkCommonDataModel',
+    'vtkSpanSpace': 'vtkCommonExecutionModel',
+    'vtkContourFilter': 'vtkFiltersCore',
+    'vtkCutter': 'vtkFiltersCore',
+    'vtkFeatureEdges': 'vtkFiltersCore',
+    'vtkPolyDataConnectivityFilter': 'vtkFiltersCore',
+    'vtkProbeFilter': 'vtkFiltersCore',
+    'vtkTriangleFilter': 'vtkFiltersCore',
+    'vtkExtractPolyDataGeometry': 'vtkFiltersExtraction',
+    'vtkEvenlySpacedStreamlines2D': 'vtkFiltersFlowPaths',
+    'vtkStreamTracer': 'vtkFiltersFlowPaths',
+    'vtkXMLImageDataReader': 'vtkIOXML',
+    'vtkXMLImageDataWriter': 'vtkIOXML',
+    'vtkXMLPolyDataReader': 'vtkIOXML',
+    'vtkXMLPolyDataWriter': 'vtkIOXML',
+    'vtkXMLUnstructuredGridReader': 'vtkIOXML',
+    'vtkXMLUnstructuredGridWriter': 'vtkIOXML',
+}
+
+
+def __getattr__(name):
+    """Import VTK class or constant name from its module and keep it as
+    attribute of this module, so it is looked up only once"""
+    if name not in MODULES:
+        raise AttributeError('module {!r} has no attribute {!r}; add it to '
+                             'MODULES'.format(__name__, name))
+    module = importlib.import_module('vtkmodules.' + MODULES[name])
+    value = globals()[name] = getattr(module, name)
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(MODULES))
@@ -0,0 +1,303 @@
+import numpy as np
+from vtkmodules.util import numpy_support
+from . import lazyvtk as vtk
+from . import proflib
+
+
+# nparray dtype corresponding to vtkIdType, from the type map of numpy_support,
+# so that no VTK object is created on import
+IDTYPE = np.dtype(numpy_support.get_numpy_array_type(
+    numpy_support.VTK_ID_TYPE)).type
+
+
+def getpoints(dataset):
+    """Return point coordinates of a vtkPointSet as (n, 3) nparray view."""
+    return numpy_support.vtk_to_numpy(dataset.GetPoints().GetData())
+
+
+def getpointarray(dataset, name):
+    """Return named point data array of a vtkDataSet as nparray view."""
+    array = dataset.GetPointData().GetArray(name)
+    if array is None:
+        raise KeyError('point data has no array ' + repr(name))
+    return numpy_support.vtk_to_numpy(array)
+
+
+def getarrays(fielddata):
+    """Return dict of all arrays of a vtkFieldData, e.g. the point data of a
+    dataset, as nparray views by name."""
+    return dict((fielddata.GetArrayName(i),
+                 numpy_support.vtk_to_numpy(fielddata.GetArray(i)))
+                for i in range(fielddata.GetNumberOfArrays()))
+
+
+def getimagearray(image, name):
+    """Return named point data array of a vtkImageData as nparray view indexed
+    [k, j, i], i.e. with shape (nz, ny, nx) plus any component axis."""
+    values = getpointarray(image, name)
+    nx, ny, nz = image.GetDimensions()
+    return values.reshape((nz, ny, nx) + values.shape[1:])
+
+
+@proflib.profiled
+def sampleimage(image, points, names):
+    """Interpolate point data arrays of a vtkImageData trilinearly
+
+    Args:
+        image: vtkImageData.
+        points: (n, 3) nparray of query point coordinates.
+        names: Names of the point data arrays to interpolate.
+
+    Returns dict of masked nparrays by name, in which points outside the extent
+    of image are masked. The voxel of each point is found by index arithmetic
+    on origin and spacing, and the interpolation is vectorized over all
+    points, so no point location is involved. Along a dimension of size 1,
+    e.g. z of a 2D image, only points in the plane of the image are inside.
+
+    """
+    points = np.asarray(points, dtype=np.float64)
+    dimensions = np.array(image.GetDimensions())
+    index = ((points - image.GetOrigin()) / image.GetSpacing() -
+             image.GetExtent()[::2])
+
+    # lower corner of the voxel of each point and weight of the upper corner
+    tolerance = 1e-6
+    outside = ((index < -tolerance) |
+               (index > dimensions - 1 + tolerance)).any(axis=1)
+    lower = np.clip(np.floor(index), 0, np.maximum(dimensions - 2, 0))
+    weight = np.clip(index - lower, 0, 1)
+    lower = lower.astype(np.intp)
+    upper = np.minimum(lower + 1, dimensions - 1)
+
+    samples = {}
+    for name in names:
+        values = getimagearray(image, name)
+        result = 0
+        for corner in range(8):
+            di, dj, dk = corner & 1, corner >> 1 & 1, corner >> 2 & 1
+            w = ((weight[:, 0] if di else 1 - weight[:, 0]) *
+                 (weight[:, 1] if dj else 1 - weight[:, 1]) *
+                 (weight[:, 2] if dk else 1 - weight[:, 2]))
+            i, j, k = [(upper if d else lower)[:, axis]
+                       for axis, d in enumerate((di, dj, dk))]
+            result = result + (w.reshape(w.shape + (1,) * (values.ndim - 3)) *
+                               values[k, j, i])
+        mask = outside.reshape(outside.shape + (1,) * (values.ndim - 3))
+        samples[name] = np.ma.masked_array(
+            result, mask=np.broadcast_to(mask, result.shape))
+    return samples
+
+
+def _getcellarray(cellarray, cellsize):
+    """Return (n, cellsize) view of pointids of a vtkCellArray with cells of
+    equal size."""
+    if hasattr(cellarray, 'GetConnectivityArray'):
+        # VTK >= 9 stores offsets and connectivity in separate arrays
+        ids = numpy_support.vtk_to_numpy(cellarray.GetConnectivityArray())
+        if ids.size != cellsize * cellarray.GetNumberOfCells():
+            raise ValueError('cells are not all of size ' + str(cellsize))
+        return ids.reshape(-1, cellsize)
+
+    # legacy layout: (npts, id0, id1, ..., npts, id0, id1, ...)
+    ids = numpy_support.vtk_to_numpy(cellarray.GetData())
+    ids = ids.reshape(-1, cellsize + 1)
+    if (ids[:, 0] != cellsize).any():
+        raise ValueError('cells are not all of size ' + str(cellsize))
+    return ids[:, 1:]
+
+
+def gettriangles(polydata):
+    """Return pointids per triangle of a triangulated vtkPolyData as (n, 3)
+    nparray view."""
+    return _getcellarray(polydata.GetPolys(), 3)
+
+
+def getlines(polydata):
+    """Return pointids per line segment of a vtkPolyData as (n, 2) nparray
+    view, e.g. for the output of vtkFeatureEdges."""
+    return _getcellarray(polydata.GetLines(), 2)
+
+
+@proflib.profiled
+def chainlines(lines):
+    """Chain line segments into polylines
+
+    Args:
+        lines: (n, 2) nparray of pointids per line segment, e.g. from getlines.
+
+    Returns list of nparrays with the pointids of each polyline, in order: first
+    the open polylines, from one end to the other, then the closed loops, which
+    end with their first pointid. The orientation of the line segments does not
+    matter. Points shared by more than two line segments, e.g. where two loops
+    touch, are ends of the polylines that meet there, so that each line segment
+    is part of exactly one polyline.
+
+    The neighbours of each point are found with a vectorized sort, after which
+    each polyline is walked point by point, so the time is about linear in the
+    number of line segments.
+
+    """
+    lines = np.asarray(lines)
+    lines = lines[lines[:, 0] != lines[:, 1]]
+    if lines.size == 0:
+        return []
+    points = lines.ravel()
+    degree = np.bincount(points)
+
+    # neighbours of each point: neighbours[offsets[i]:offsets[i + 1]]
+    offsets = np.concatenate(([0], np.cumsum(degree)))
+    neighbours = points[np.argsort(points, kind='stable') ^ 1]
+
+    # first and second neighbour of each point inside a polyline, i.e. of
+    # each point shared by exactly two line segments, or -1
+    inner = degree == 2
+    first = np.full(degree.size, -1)
+    first[inner] = neighbours[offsets[:-1][inner] + 1]
+    second = np.full(degree.size, -1)
+    second[inner] = neighbours[offsets[:-1][inner]]
+
+    neighbours = neighbours.tolist()
+    offsets = offsets.tolist()
+    first = first.tolist()
+    second = second.tolist()
+    visited = np.zeros(degree.size, dtype=bool)  # points inside polylines
+    polylines = []
+
+    # open polylines, from each end along each of its line segments
+    for start in np.flatnonzero(~inner & (degree > 0)).tolist():
+        for following in neighbours[offsets[start]:offsets[start + 1]]:
+            if visited[following] or (not inner[following] and
+                                      following < start):
+                continue  # walked from the other end
+            chain = [start, following]
+            previous, current = start, following
+            while inner[current]:
+                following = first[current]
+                if following == previous:
+                    following = second[current]
+                chain.append(following)
+                previous, current = current, following
+            chain = np.array(chain)
+            visited[chain[1:-1]] = True
+            polylines.append(chain)
+
+    # closed loops of the remaining points
+    for start in np.flatnonzero(inner).tolist():
+        if visited[start]:
+            continue
+        chain = [start]
+        previous, current = -1, start
+        while True:
+            following = first[current]
+            if following == previous:
+                following = second[current]
+            chain.append(following)
+            if following == start:
+                break
+            previous, current = current, following
+        chain = np.array(chain)
+        visited[chain] = True
+        polylines.append(chain)
+    return polylines
+
+
+def makepoints(coordinates, deep=True):
+    """Create vtkPoints from (n, 3) nparray of coordinates. If not deep, the
+    points reference the coordinates without copying them."""
+    coordinates = np.ascontiguousarray(coordinates)
+    if coordinates.dtype not in (np.float32, np.float64):
+        coordinates = coordinates.astype(np.float64)
+    points = vtk.vtkPoints()
+    points.SetData(numpy_support.numpy_to_vtk(coordinates, deep=deep))
+    return points
+
+
+def makearray(values, name, deep=True):
+    """Create named vtkDataArray from nparray. If not deep, the array
+    references values without copying them."""
+    array = numpy_support.numpy_to_vtk(np.ascontiguousarray(values),
+                                       deep=deep)
+    array.SetName(name)
+    return array
+
+
+def getcellarray(cellarray):
+    """Return connectivity and offsets of a vtkCellArray as nparray views."""
+    return (numpy_support.vtk_to_numpy(cellarray.GetConnectivityArray()),
+            numpy_support.vtk_to_numpy(cellarray.GetOffsetsArray()))
+
+
+def getcells(grid):
+    """Return connectivity, offsets and cell types of a vtkUnstructuredGrid as
+    nparray views."""
+    connectivity, offsets = getcellarray(grid.GetCells())
+    return (connectivity, offsets,
+            numpy_support.vtk_to_numpy(grid.GetCellTypesArray()))
+
+
+def makeunstructuredgrid(points, connectivity, offsets, celltypes,
+                         pointarrays={}):
+    """Create vtkUnstructuredGrid from nparrays
+
+    Args:
+        points: (n, 3) nparray of point coordinates.
+        connectivity: Pointids of all cells, one cell after the other.
+        offsets: Start of each cell in connectivity, plus its total length.
+        celltypes: VTK cell type of each cell.
+        pointarrays: Dict of point data nparrays by name.
+
+    The grid references the nparrays without copying them, except where their
+    dtype needs converting, e.g. connectivity and offsets to vtkIdType. The
+    nparrays must therefore be contiguous and writeable, e.g. loaded with
+    mmap_mode='c' instead of 'r'.
+
+    """
+    cells = vtk.vtkCellArray()
+    cells.SetData(
+        numpy_support.numpy_to_vtkIdTypeArray(
+            np.ascontiguousarray(offsets, dtype=IDTYPE)),
+        numpy_support.numpy_to_vtkIdTypeArray(
+            np.ascontiguousarray(connectivity, dtype=IDTYPE)))
+
+    grid = vtk.vtkUnstructuredGrid()
+    grid.SetPoints(makepoints(points, deep=False))
+    grid.SetCells(numpy_support.numpy_to_vtk(
+                      np.ascontiguousarray(celltypes, dtype=np.uint8),
+                      array_type=vtk.VTK_UNSIGNED_CHAR),
+                  cells)
+    for name, values in pointarrays.items():
+        grid.GetPointData().AddArray(makearray(values, name, deep=False))
+    return grid
+
+
+def makepolydata(points, triangles, pointarrays={}):
+    """Create triangulated vtkPolyData from (n, 3) nparray of point
+    coordinates, (m, 3) nparray of pointids per triangle and a dict of point
+    data nparrays by name."""
+    triangles = np.asarray(triangles)
+    cells = vtk.vtkCellArray()
+    cells.SetData(
+        numpy_support.numpy_to_vtkIdTypeArray(
+            np.arange(0, 3 * len(triangles) + 1, 3, dtype=IDTYPE), deep=True),
+        numpy_support.numpy_to_vtkIdTypeArray(
+            np.ascontiguousarray(triangles.ravel(), dtype=IDTYPE), deep=True))
+
+    polydata = vtk.vtkPolyData()
+    polydata.SetPoints(makepoints(points))
+    polydata.SetPolys(cells)
+    for name, values in pointarrays.items():
+        polydata.GetPointData().AddArray(makearray(values, name))
+    return polydata
+
+
+def makeimagedata(origin, spacing, extent, pointarrays={}):
+    """Create vtkImageData from origin, spacing, extent and a dict of point
+    data nparrays by name, ordered with x fastest. The image references the
+    nparrays without copying them."""
+    image = vtk.vtkImageData()
+    image.SetOrigin(origin)
+    image.SetSpacing(spacing)
+    image.SetExtent(extent)
+    for name, values in pointarrays.items():
+        image.GetPointData().AddArray(makearray(values, name, deep=False))
+    return image
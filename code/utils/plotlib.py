@@ -1,67 +1,155 @@
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-import numpy as np
-
-
-def colorbar(path='colorbar.pdf', vmin=0, vmax=1, unit='[-]',
-             colors='RdBu_r', nlevels=None, orientation='horizontal',
-             extend='neither'):
-    """Create colorbar as separate figure and write to disk.
-
-    Args:
-        vmin: Lower limit of colorbar range.
-        vmax: Upper limit of colorbar range.
-        unit: String to label colorbar.
-        colors: Colormap (see matplotlib website for options).
-        nlevel: Number of colors for discrete colorbar; 'None' gives continuous
-            colorbar.
-        orientation ('horizontal', 'vertical'): Orientation of colorbar.
-        extend ('neither', 'both', 'min', 'max'): Extend colorbar to show
-            out-of-range values.
-
-    """
-
-    if orientation == 'horizontal':
-        figsize = (9, .5)
-    else:
-        figsize = (.5, 9)
-
-    fig = plt.figure(figsize=figsize)
-    ax = fig.add_subplot(111)
-
-    # Initiate colormap
-    cmap = mpl.cm.get_cmap(colors)
-
-    # Define norm to correspond to the data for which the colorbar will be
-    # used. If nlevels is given, the colorbar will be discrete.
-    if nlevels == None:
-        norm = mpl.colors.Normalize(vmin, vmax)
-    else:
-        bounds = np.linspace(vmin, vmax, nlevels)
-        norm = mpl.colors.BoundaryNorm(bounds, cmap.N)
-
-    # ColorBarBase derives from ScalarMappable and puts a colorbar in a
-    # specified axes
-    cbar = mpl.colorbar.ColorbarBase(ax,
-                                     cmap=cmap,
-                                     norm=norm,
-                                     orientation=orientation,
-                                     ticks=[vmin, (vmax+vmin) / 2., vmax],
-                                     extend=extend)
-
-    # Set font properties and align ticks within colorbar edges
-    if orientation == 'horizontal':
-        ax.set_xlabel(unit, fontsize=36)
-        ax.xaxis.set_tick_params(labelsize=32)
-        ax.get_xticklabels()[0].set_horizontalalignment('left')
-        ax.get_xticklabels()[2].set_horizontalalignment('right')
-    else:
-        ax.set_xlabel(unit, fontsize=36)
-        ax.yaxis.set_tick_params(labelsize=32)
-        ax.get_yticklabels()[0].set_verticalalignment('bottom')
-        ax.get_yticklabels()[2].set_verticalalignment('top')
-
-    # Hack to remove white gaps in Preview
-    cbar.solids.set_edgecolor("face")
-
-    fig.savefig(path, bbox_inches='tight', pad_inches=0.05)
+import collections
+import weakref
+import matplotlib as mpl
+import matplotlib.pyplot as plt
+import matplotlib.tri as mtri
+import numpy as np
+from . import numpylib
+from . import proflib
+from . import vtklib
+
+
+# Slice meshes of recently plotted slices, keyed by slice identity and mesh
+# parameters and ordered from least to most recently used (see getslicemesh).
+SLICEMESHCACHESIZE = 8
+_slicemeshes = collections.OrderedDict()
+
+
+class SliceMesh(object):
+    """Triangulated slice in compact form for plotting
+
+    Holds the in-plane point coordinates x and y as float64 nparrays, the
+    point data arrays (fields, by name) as float32 nparrays and the pointids
+    per triangle as contiguous int32 nparray. The matplotlib Triangulation is
+    built on first use and kept, so all plots of the mesh share it, including
+    the edges and neighbours it computes. It uses x and y without converting
+    them, but copies the triangles, so the mesh then keeps only the copy of
+    the Triangulation. The mesh thus takes 16 bytes per point for the
+    coordinates plus 4 bytes per point and field, and 12 bytes per triangle.
+
+    """
+
+    __slots__ = ('x', 'y', 'triangles', 'fields', '_triangulation')
+
+    def __init__(self, x, y, triangles, fields={}):
+        self.x = np.ascontiguousarray(x, dtype=np.float64)
+        self.y = np.ascontiguousarray(y, dtype=np.float64)
+        self.triangles = np.ascontiguousarray(triangles, dtype=np.int32)
+        self.fields = dict((name, np.ascontiguousarray(values,
+                                                       dtype=np.float32))
+                           for name, values in fields.items())
+        self._triangulation = None
+
+    @classmethod
+    @proflib.profiled
+    def frompolydata(cls, polydata, axes=(0, 1)):
+        """Create mesh from triangulated polydata, with coordinates axes of
+        its points as x and y, e.g. axes=(2, 1) for z and y."""
+        points = numpylib.getpoints(polydata)
+        return cls(points[:, axes[0]], points[:, axes[1]],
+                   numpylib.gettriangles(polydata),
+                   numpylib.getarrays(polydata.GetPointData()))
+
+    @property
+    def nbytes(self):
+        """Number of bytes of the arrays of the mesh"""
+        return (self.x.nbytes + self.y.nbytes + self.triangles.nbytes +
+                sum(values.nbytes for values in self.fields.values()))
+
+    @property
+    def triangulation(self):
+        """matplotlib Triangulation of the mesh, built on first use"""
+        if self._triangulation is None:
+            self._triangulation = mtri.Triangulation(self.x, self.y,
+                                                     self.triangles)
+            self.triangles = self._triangulation.triangles
+        return self._triangulation
+
+
+@proflib.profiled
+def getslicemesh(polydata, axes=(0, 1), tolerance=None, targetcells=None):
+    """Return SliceMesh of slice polydata, triangulated and simplified with
+    tolerance or targetcells (see vtklib.simplify).
+
+    The mesh is created once per slice and parameters and kept in a small LRU
+    cache, so repeated plots of the same slice share the mesh and its
+    triangulation. The mesh is recreated when the slice is modified.
+
+    """
+    key = (id(polydata), polydata.GetMTime(), tuple(axes), tolerance,
+           targetcells)
+    entry = _slicemeshes.pop(key, None)
+    if entry is None or entry[0]() is not polydata:
+        surface = vtklib.simplify(vtklib.triangulate(polydata), tolerance,
+                                  targetcells)
+        entry = (weakref.ref(polydata),
+                 SliceMesh.frompolydata(surface, axes))
+    _slicemeshes[key] = entry
+    while len(_slicemeshes) > SLICEMESHCACHESIZE:
+        _slicemeshes.popitem(last=False)
+    return entry[1]
+
+
+@proflib.profiled
+def colorbar(path='colorbar.pdf', vmin=0, vmax=1, unit='[-]',
+             colors='RdBu_r', nlevels=None, orientation='horizontal',
+             extend='neither'):
+    """Create colorbar as separate figure and write to disk.
+
+    Args:
+        vmin: Lower limit of colorbar range.
+        vmax: Upper limit of colorbar range.
+        unit: String to label colorbar.
+        colors: Colormap (see matplotlib website for options).
+        nlevel: Number of colors for discrete colorbar; 'None' gives continuous
+            colorbar.
+        orientation ('horizontal', 'vertical'): Orientation of colorbar.
+        extend ('neither', 'both', 'min', 'max'): Extend colorbar to show
+            out-of-range values.
+
+    """
+
+    if orientation == 'horizontal':
+        figsize = (9, .5)
+    else:
+        figsize = (.5, 9)
+
+    fig = plt.figure(figsize=figsize)
+    ax = fig.add_subplot(111)
+
+    # Initiate colormap
+    cmap = plt.get_cmap(colors)
+
+    # Define norm to correspond to the data for which the colorbar will be
+    # used. If nlevels is given, the colorbar will be discrete.
+    if nlevels == None:
+        norm = mpl.colors.Normalize(vmin, vmax)
+    else:
+        bounds = np.linspace(vmin, vmax, nlevels)
+        norm = mpl.colors.BoundaryNorm(bounds, cmap.N)
+
+    # ColorBarBase derives from ScalarMappable and puts a colorbar in a
+    # specified axes
+    cbar = mpl.colorbar.ColorbarBase(ax,
+                                     cmap=cmap,
+                                     norm=norm,
+                                     orientation=orientation,
+                                     ticks=[vmin, (vmax+vmin) / 2., vmax],
+                                     extend=extend)
+
+    # Set font properties and align ticks within colorbar edges
+    if orientation == 'horizontal':
+        ax.set_xlabel(unit, fontsize=36)
+        ax.xaxis.set_tick_params(labelsize=32)
+        ax.get_xticklabels()[0].set_horizontalalignment('left')
+        ax.get_xticklabels()[2].set_horizontalalignment('right')
+    else:
+        ax.set_xlabel(unit, fontsize=36)
+        ax.yaxis.set_tick_params(labelsize=32)
+        ax.get_yticklabels()[0].set_verticalalignment('bottom')
+        ax.get_yticklabels()[2].set_verticalalignment('top')
+
+    # Hack to remove white gaps in Preview
+    cbar.solids.set_edgecolor("face")
+
+    fig.savefig(path, bbox_inches='tight', pad_inches=0.05)
@@ -0,0 +1,220 @@
+import cProfile
+import functools
+import json
+import os
+import re
+import sys
+import time
+
+
+# Stages (see stage and profiled) are only recorded if PROFILETRACE is set, as
+# one JSON object per line appended to that file. If PROFILEDIR is set too,
+# each outermost stage is also profiled with cProfile and its statistics are
+# dumped there. Both are read from the environment, so that worker processes
+# inherit them, and are set by enable.
+PROFILETRACE = os.environ.get('VISC11_PROFILE') or None
+PROFILEDIR = os.environ.get('VISC11_CPROFILE') or None
+_stages = []  # stages in progress, from outermost to innermost
+_trace = None  # trace file, opened on first record
+
+
+def enable(trace=None, profiledir=None):
+    """Record stages to JSON-lines file trace and, if profiledir is given, dump
+    cProfile statistics of outermost stages to directory profiledir. Worker
+    processes started afterwards inherit the settings. Arguments that are None
+    leave the current setting unchanged."""
+    global PROFILETRACE, PROFILEDIR
+    if trace is None and profiledir is not None and PROFILETRACE is None:
+        trace = 'profile.jsonl'
+    if trace is not None:
+        PROFILETRACE = os.environ['VISC11_PROFILE'] = os.path.abspath(trace)
+    if profiledir is not None:
+        PROFILEDIR = os.environ['VISC11_CPROFILE'] = os.path.abspath(
+            profiledir)
+        if not os.path.exists(PROFILEDIR):
+            os.makedirs(PROFILEDIR)
+
+
+def addarguments(parser):
+    """Add --profile and --cprofile options to argparse parser, to be passed to
+    enable"""
+    parser.add_argument('--profile', nargs='?', const='profile.jsonl',
+                        metavar='TRACE',
+                        help='record time and memory of each stage to '
+                             'JSON-lines file TRACE (default: profile.jsonl)')
+    parser.add_argument('--cprofile', metavar='DIRECTORY',
+                        help='also dump cProfile statistics per case '
+                             '(outermost stage) to DIRECTORY')
+
+
+def resetpeakrss():
+    """Reset the peak RSS of this process to its current RSS (Linux only)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def getrss():
+    """Return current and peak RSS of this process in bytes. Without /proc,
+    both are the peak RSS from getrusage, which cannot be reset."""
+    rss = {}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    rss[line[:5]] = int(line.split()[1]) * 1024
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != 'darwin':
+            peak *= 1024  # kilobytes
+        rss = {'VmRSS': peak, 'VmHWM': peak}
+    return rss['VmRSS'], rss['VmHWM']
+
+
+def outputsize(value):
+    """Return dict of the size of value: the number of bytes of a VTK data
+    object, nparray, object with nbytes or existing file path, plus the number
+    of cells and points of a VTK dataset, summed over the items of a list,
+    tuple or dict. Returns None for other values."""
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (list, tuple)):
+        size = {}
+        for item in value:
+            for key, count in (outputsize(item) or {}).items():
+                size[key] = size.get(key, 0) + count
+        return size or None
+    if hasattr(value, 'GetActualMemorySize'):
+        size = dict(bytes=value.GetActualMemorySize() * 1024)
+        if hasattr(value, 'GetNumberOfCells'):
+            size.update(cells=value.GetNumberOfCells(),
+                        points=value.GetNumberOfPoints())
+        return size
+    if hasattr(value, 'nbytes'):
+        return dict(bytes=int(value.nbytes))
+    if isinstance(value, str) and os.path.isfile(value):
+        return dict(bytes=os.path.getsize(value))
+    return None
+
+
+def _write(record):
+    """Append record to the trace file"""
+    global _trace
+    if _trace is None or _trace.name != PROFILETRACE:
+        _trace = open(PROFILETRACE, 'a', buffering=1)
+    _trace.write(json.dumps(record, default=str) + '\n')
+
+
+class _Stage(object):
+    """Stage in progress, recorded on exit"""
+
+    __slots__ = ('name', 'info', 'path', 'output', 'profile', 'rss', 'peak',
+                 'start', 'wall', 'cpu')
+
+    def __init__(self, name, info):
+        self.name = name
+        self.info = info
+        self.output = None
+        self.profile = None
+
+    def setoutput(self, value):
+        """Record the size of value as output of the stage (see outputsize)"""
+        self.output = value
+
+    def __enter__(self):
+        if _stages:
+            # resetting the peak RSS for this stage hides it from the outer
+            # stages, so they keep track of it themselves
+            parent = _stages[-1]
+            parent.peak = max(parent.peak, getrss()[1])
+        self.path = '/'.join([stage.name for stage in _stages] + [self.name])
+        if PROFILEDIR is not None and not _stages:
+            self.profile = cProfile.Profile()
+        _stages.append(self)
+        self.rss = getrss()[0]
+        resetpeakrss()
+        self.peak = self.rss
+        if self.profile is not None:
+            self.profile.enable()
+        self.start = time.time()
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, exctype, excvalue, tb):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        if self.profile is not None:
+            self.profile.disable()
+            name = re.sub(r'[^\w.+-]+', '_', self.path)
+            self.profile.dump_stats(os.path.join(
+                PROFILEDIR, '{:s}-{:d}.prof'.format(name, os.getpid())))
+        self.peak = max(self.peak, getrss()[1])
+        _stages.pop()
+        if _stages:
+            _stages[-1].peak = max(_stages[-1].peak, self.peak)
+
+        record = dict(stage=self.path, name=self.name, pid=os.getpid(),
+                      start=self.start, wall=wall, cpu=cpu, rss=self.rss,
+                      peakrss=self.peak, output=outputsize(self.output))
+        if exctype is not None:
+            record['error'] = exctype.__name__
+        record.update(self.info)
+        _write(record)
+        return False
+
+
+class _NoStage(object):
+    """Stage that is not recorded"""
+
+    __slots__ = ()
+
+    def setoutput(self, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exctype, excvalue, tb):
+        return False
+
+
+_nostage = _NoStage()
+
+
+def stage(name, **info):
+    """Context manager that records stage name, when enabled (see enable)
+
+    On exit, a JSON object is appended to the trace, with the path of the
+    stage (the names of the enclosing stages and name, separated by '/'), its
+    wall time and CPU time in seconds, the RSS of the process at its start and
+    its peak RSS in bytes, the size of its output as set with setoutput of the
+    context (see outputsize), and info. For example,
+
+        with proflib.stage('savefig', dpi=200) as savefig:
+            fig.savefig(ofile, dpi=200)
+            savefig.setoutput(ofile)
+
+    When not enabled, the context does nothing.
+
+    """
+    if PROFILETRACE is None:
+        return _nostage
+    return _Stage(name, info)
+
+
+def profiled(function):
+    """Decorate function to record each call as stage with the name of the
+    function and its return value as output (see stage)"""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if PROFILETRACE is None:
+            return function(*args, **kwargs)
+        with _Stage(function.__name__, {}) as context:
+            result = function(*args, **kwargs)
+            context.setoutput(result)
+        return result
+    return wrapper
@@ -0,0 +1,138 @@
+import numpy as np
+from . import numpylib
+
+
+# VTK cell type of tetrahedra
+VTK_TETRA = 10
+
+# Tetrahedra of the split of a hexahedron along its diagonal from corner 0 to
+# corner 6, as local corner ids in VTK order. All hexahedra of a grid split the
+# same way share faces with their neighbours, so the tetrahedra are conforming.
+HEXTETRAS = np.array([[0, 1, 2, 6], [0, 2, 3, 6], [0, 3, 7, 6],
+                      [0, 7, 4, 6], [0, 4, 5, 6], [0, 5, 1, 6]])
+
+
+def tuberadius(x, radius=1.5, bulge=2., width=2.):
+    """Radius of the tube at x (in mm), radius plus a Gaussian bulge of height
+    bulge and width width centred at x = 0."""
+    return radius + bulge * np.exp(-(x / width)**2)
+
+
+def tubeflow(points, radius=1.5, bulge=2., width=2., velocity=50.):
+    """Analytic flow through a tube along the x-axis with a bulge at x = 0
+
+    The flow has a parabolic profile with centreline velocity velocity (in
+    mm/s) where the tube has radius radius, and follows the tube wall, i.e.
+    points at a given fraction of the local radius stay at that fraction. It
+    mimics the flow through an aneurysm without its recirculation.
+
+    Returns a dict of float32 nparrays Vx_mm_s, Vy_mm_s and Vxy_mm_s for the
+    points; the velocity is zero outside the tube.
+
+    """
+    x, y, z = np.asarray(points, dtype=float).T
+    wall = tuberadius(x, radius, bulge, width)
+    slope = -2 * x / width**2 * (wall - radius)
+    vx = (velocity * (radius / wall)**2 *
+          np.clip(1 - (y*y + z*z) / wall**2, 0, None))
+    vy = vx * slope * y / wall
+    return {'Vx_mm_s': vx.astype(np.float32),
+            'Vy_mm_s': vy.astype(np.float32),
+            'Vxy_mm_s': np.sqrt(vx*vx + vy*vy).astype(np.float32)}
+
+
+def tubevolume(length=16., radius=1.5, bulge=2., width=2.):
+    """Volume (in mm^3) of the tube between x = -length/2 and length/2"""
+    x = (np.arange(10000) + .5) / 10000 * length - length / 2.
+    return np.pi * (tuberadius(x, radius, bulge, width)**2).mean() * length
+
+
+def tubegrid(numberofcells=1e6, length=16., radius=1.5, bulge=2., width=2.,
+             velocity=50.):
+    """Create unstructured grid of tetrahedra in a tube with analytic flow
+
+    The tube runs along the x-axis between x = -length/2 and length/2 (in mm)
+    and bulges at x = 0 (see tuberadius). Its grid consists of the cubes of an
+    evenly spaced lattice with their centre in the tube, each split into six
+    tetrahedra, with the spacing chosen for about numberofcells tetrahedra.
+    The grid carries the point data of tubeflow, like the CFD datasets.
+
+    """
+    spacing = (6 * tubevolume(length, radius, bulge, width) /
+               numberofcells)**(1 / 3.)
+    rmax = radius + bulge
+    origin = np.array([-length / 2., -rmax, -rmax])
+    shape = np.ceil([length / spacing, 2 * rmax / spacing,
+                     2 * rmax / spacing]).astype(int)
+    nx, ny, nz = shape + 1
+
+    # lattice ids (i, j, k) of the cubes with their centre in the tube, one
+    # z-layer of cubes at a time to limit memory
+    xcentres = origin[0] + (np.arange(shape[0]) + .5) * spacing
+    ycentres = origin[1] + (np.arange(shape[1]) + .5) * spacing
+    wall2 = tuberadius(xcentres, radius, bulge, width)**2
+    layers = []
+    for k in range(shape[2]):
+        z = origin[2] + (k + .5) * spacing
+        j, i = np.nonzero(np.add.outer(ycentres**2 + z*z, -wall2) < 0)
+        layers.append((k, i, j))
+
+    # pointids in the lattice of the tetrahedra of the cubes, from the corner
+    # pointids of the cubes in VTK order, filled in one layer at a time
+    corners = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0],
+                        [0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1]])
+    strides = np.array([1, nx, nx * ny], dtype=numpylib.IDTYPE)
+    tetraoffsets = corners.dot(strides)[HEXTETRAS].ravel()
+    numberofcubes = sum(i.size for k, i, j in layers)
+    connectivity = np.empty(numberofcubes * tetraoffsets.size,
+                            dtype=numpylib.IDTYPE)
+    start = 0
+    for k, i, j in layers:
+        end = start + i.size * tetraoffsets.size
+        connectivity[start:end].reshape(-1, tetraoffsets.size)[:] = (
+            (i + nx * (j + ny * k)).astype(numpylib.IDTYPE)[:, None] +
+            tetraoffsets)
+        start = end
+    del layers
+
+    # keep only the lattice points used by the tetrahedra and renumber them,
+    # in place and in chunks to limit memory
+    used = np.zeros(nx * ny * nz, dtype=bool)
+    used[connectivity] = True
+    pointids = np.flatnonzero(used)
+    del used
+    newids = np.full(nx * ny * nz, -1, dtype=numpylib.IDTYPE)
+    newids[pointids] = np.arange(pointids.size)
+    chunksize = 2**24
+    for start in range(0, connectivity.size, chunksize):
+        chunk = connectivity[start:start + chunksize]
+        chunk[:] = newids[chunk]
+    del newids
+    k, rest = np.divmod(pointids, nx * ny)
+    j, i = np.divmod(rest, nx)
+    points = (origin + spacing * np.column_stack((i, j, k))).astype(
+        np.float32)
+
+    numberoftetras = connectivity.size // 4
+    return numpylib.makeunstructuredgrid(
+        points, connectivity, np.arange(0, 4 * numberoftetras + 1, 4),
+        np.full(numberoftetras, VTK_TETRA, dtype=np.uint8),
+        tubeflow(points, radius, bulge, width, velocity))
+
+
+def tubeimage(spacing=0.2, length=16., radius=1.5, bulge=2., width=2.,
+              velocity=50.):
+    """Create 2D image of the analytic flow in the xy-plane at z = 0, like the
+    PIV dataset, with the given spacing (in mm) over the extent of the tube
+    (see tubegrid)."""
+    rmax = radius + bulge
+    origin = [-length / 2., -rmax, 0.]
+    nx = int(np.ceil(length / spacing)) + 1
+    ny = int(np.ceil(2 * rmax / spacing)) + 1
+    y, x = np.mgrid[0:ny, 0:nx] * spacing
+    points = np.column_stack((x.ravel() + origin[0], y.ravel() + origin[1],
+                              np.zeros(x.size)))
+    return numpylib.makeimagedata(origin, [spacing, spacing, spacing],
+                                  [0, nx - 1, 0, ny - 1, 0, 0],
+                                  tubeflow(points, radius, bulge, width,
+                                           velocity))
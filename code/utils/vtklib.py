@@ -1,45 +1,407 @@
-import vtk
-
-
-def extractfeatureedges(surface, boundary_edges=True,
-                        feature_edges=False, feature_angle=30):
-    """Extract feature edges of a surface mesh. Defaults to extracting boundary
-    edges."""
-    edge = vtk.vtkFeatureEdges()
-    edge.SetInputData(surface)
-    edge.BoundaryEdgesOn() if boundary_edges else edge.BoundaryEdgesOff()
-    edge.FeatureEdgesOn() if feature_edges else edge.FeatureEdgesOff()
-    edge.SetFeatureAngle(feature_angle)
-    edge.Update()
-    return edge.GetOutput()
-
-
-def extractclosestpointregion(polydata, point=[0, 0, 0]):
-    """Extract region closest to specified point."""
-    connect = vtk.vtkPolyDataConnectivityFilter()
-    connect.SetInputData(polydata)
-    connect.SetExtractionModeToClosestPointRegion()
-    connect.SetClosestPoint(point)
-    connect.Update()
-    return connect.GetOutput()
-
-
-def slicedataset(dataset, point, normal):
-    """Slice through a vtkDataSet object with a plane defined by point and
-    normal."""
-    cutplane = vtk.vtkPlane()
-    cutplane.SetOrigin(point)
-    cutplane.SetNormal(normal)
-    cutter = vtk.vtkCutter()
-    cutter.SetInputData(dataset)
-    cutter.SetCutFunction(cutplane)
-    cutter.Update()
-    return cutter.GetOutput()
-
-
-def triangulate(surface):
-    """Triangulate a surface mesh."""
-    trianglefilter = vtk.vtkTriangleFilter()
-    trianglefilter.SetInputData(surface)
-    trianglefilter.Update()
-    return trianglefilter.GetOutput()
+import collections
+import hashlib
+import os
+import weakref
+import numpy as np
+from . import iolib
+from . import lazyvtk as vtk
+from . import numpylib
+from . import proflib
+
+
+# Static cell locators of recently probed datasets, keyed by dataset identity
+# and ordered from least to most recently used (see getcelllocator). Entries
+# are dropped as soon as their dataset is no longer referenced elsewhere.
+CELLLOCATORCACHESIZE = 4
+_celllocators = collections.OrderedDict()
+
+# Slices of recently sliced datasets, keyed by dataset identity and plane and
+# ordered from least to most recently used (see slicedataset). The cache holds
+# at most SLICECACHESIZE MiB of slices. If SLICECACHEDIR is set, slices are also
+# stored there by dataset content hash, so they survive between runs.
+SLICECACHESIZE = float(os.environ.get('VISC11_SLICECACHESIZE', 256))
+SLICECACHEDIR = os.environ.get('VISC11_SLICECACHEDIR')
+_slices = collections.OrderedDict()
+_slicecachesize = 0  # KiB
+_datasethashes = {}
+
+
+@proflib.profiled
+def extractfeatureedges(surface, boundary_edges=True,
+                        feature_edges=False, feature_angle=30):
+    """Extract feature edges of a surface mesh. Defaults to extracting boundary
+    edges."""
+    edge = vtk.vtkFeatureEdges()
+    edge.SetInputData(surface)
+    edge.BoundaryEdgesOn() if boundary_edges else edge.BoundaryEdgesOff()
+    edge.FeatureEdgesOn() if feature_edges else edge.FeatureEdgesOff()
+    edge.SetFeatureAngle(feature_angle)
+    edge.Update()
+    return edge.GetOutput()
+
+
+def extractclosestpointregion(polydata, point=[0, 0, 0]):
+    """Extract region closest to specified point."""
+    connect = vtk.vtkPolyDataConnectivityFilter()
+    connect.SetInputData(polydata)
+    connect.SetExtractionModeToClosestPointRegion()
+    connect.SetClosestPoint(point)
+    connect.Update()
+    return connect.GetOutput()
+
+
+def _cut(dataset, point, normal):
+    """Cut dataset with the plane defined by point and normal."""
+    cutplane = vtk.vtkPlane()
+    cutplane.SetOrigin(point)
+    cutplane.SetNormal(normal)
+    cutter = vtk.vtkCutter()
+    cutter.SetInputData(dataset)
+    cutter.SetCutFunction(cutplane)
+    cutter.Update()
+    return cutter.GetOutput()
+
+
+def _hasharray(sha1, array):
+    """Update sha1 with the contents of an nparray."""
+    sha1.update(str(array.dtype).encode())
+    sha1.update(str(array.shape).encode())
+    sha1.update(np.ascontiguousarray(array).view(np.uint8))
+
+
+def datasethash(dataset):
+    """Return content hash of dataset: its geometry, cells and point data.
+
+    The hash is computed once per dataset and remembered until the dataset is
+    modified or deleted.
+
+    """
+    key = id(dataset)
+    entry = _datasethashes.get(key)
+    if (entry is not None and entry[0]() is dataset and
+            entry[1] == dataset.GetMTime()):
+        return entry[2]
+
+    sha1 = hashlib.sha1(dataset.GetClassName().encode())
+    if isinstance(dataset, vtk.vtkImageData):
+        sha1.update(repr((dataset.GetOrigin(), dataset.GetSpacing(),
+                          dataset.GetExtent())).encode())
+    else:
+        _hasharray(sha1, numpylib.getpoints(dataset))
+    if isinstance(dataset, vtk.vtkUnstructuredGrid):
+        for array in numpylib.getcells(dataset):
+            _hasharray(sha1, array)
+    elif isinstance(dataset, vtk.vtkPolyData):
+        for cells in (dataset.GetVerts(), dataset.GetLines(),
+                      dataset.GetPolys(), dataset.GetStrips()):
+            for array in numpylib.getcellarray(cells):
+                _hasharray(sha1, array)
+    pointdata = dataset.GetPointData()
+    for i in range(pointdata.GetNumberOfArrays()):
+        name = pointdata.GetArrayName(i)
+        sha1.update(name.encode())
+        _hasharray(sha1, numpylib.getpointarray(dataset, name))
+
+    digest = sha1.hexdigest()
+    for stale in [k for k, e in _datasethashes.items() if e[0]() is None]:
+        del _datasethashes[stale]
+    _datasethashes[key] = (weakref.ref(dataset), dataset.GetMTime(), digest)
+    return digest
+
+
+@proflib.profiled
+def slicedataset(dataset, point, normal, cache=True):
+    """Slice through a vtkDataSet object with a plane defined by point and
+    normal.
+
+    Slices are cached by dataset identity and plane, with LRU eviction beyond
+    SLICECACHESIZE MiB, and optionally persisted in SLICECACHEDIR. Repeated
+    cuts therefore return the same slice object, which must not be modified.
+    Use cache=False to bypass the cache.
+
+    """
+    global _slicecachesize
+    if not cache:
+        return _cut(dataset, point, normal)
+
+    plane = (tuple(float(p) for p in point), tuple(float(n) for n in normal))
+    key = (id(dataset), dataset.GetMTime(), plane)
+    entry = _slices.pop(key, None)
+    if entry is not None:
+        if entry[0]() is dataset:
+            _slices[key] = entry  # mark as most recently used
+            return entry[1]
+        _slicecachesize -= entry[2]  # dataset was deleted; identity reused
+
+    # read persisted slice or cut dataset
+    path = None
+    if SLICECACHEDIR:
+        name = hashlib.sha1(repr(plane).encode()).hexdigest()[:16]
+        path = os.path.join(SLICECACHEDIR,
+                            datasethash(dataset) + '_' + name + '.vtp')
+    if path is not None and os.path.exists(path):
+        polydata = iolib.readvtp(path)
+    else:
+        polydata = _cut(dataset, point, normal)
+        if path is not None:
+            if not os.path.exists(SLICECACHEDIR):
+                os.makedirs(SLICECACHEDIR)
+            iolib.writevtp(polydata, path)
+
+    # cache slice, evicting least recently used slices beyond the budget
+    size = polydata.GetActualMemorySize()
+    budget = SLICECACHESIZE * 1024
+    if size <= budget:
+        _slices[key] = (weakref.ref(dataset), polydata, size)
+        _slicecachesize += size
+        while _slicecachesize > budget:
+            _slicecachesize -= _slices.popitem(last=False)[1][2]
+    return polydata
+
+
+@proflib.profiled
+def slicedatasetstack(dataset, point, normal, offsets):
+    """Slice through a vtkDataSet object with a stack of parallel planes.
+
+    The planes have normal and lie at signed distances offsets from point.
+    Returns a list with the slice of each plane, in the order of offsets.
+
+    The signed distance of each point to the plane through point is computed
+    once, and each slice is its contour at the offset of the plane. The cells
+    of an unstructured grid are indexed by their distance range in a span
+    space, built once, so each contour only visits the cells that it crosses,
+    instead of all cells as a cut per plane does. The slices equal those of
+    slicedataset up to the order of their points and cells.
+
+    """
+    normal = np.asarray(normal, dtype=float)
+    normal /= np.linalg.norm(normal)
+    distance = (numpylib.getpoints(dataset) - point).dot(normal)
+
+    # contour a shallow copy of dataset, to leave its point data unchanged
+    copy = dataset.NewInstance()
+    copy.ShallowCopy(dataset)
+    copy.GetPointData().AddArray(numpylib.makearray(distance, 'Distance'))
+    contour = vtk.vtkContourFilter()
+    contour.SetInputData(copy)
+    contour.SetInputArrayToProcess(
+        0, 0, 0, vtk.vtkDataObject.FIELD_ASSOCIATION_POINTS, 'Distance')
+    contour.UseScalarTreeOn()
+    contour.SetScalarTree(vtk.vtkSpanSpace())
+    contour.ComputeScalarsOff()
+    contour.ComputeNormalsOff()
+
+    slices = []
+    for offset in offsets:
+        contour.SetValue(0, offset)
+        contour.Update()
+        polydata = vtk.vtkPolyData()
+        polydata.ShallowCopy(contour.GetOutput())
+        slices.append(polydata)
+    return slices
+
+
+@proflib.profiled
+def extractbox(polydata, bounds):
+    """Extract cells of polydata that lie within or cross the box bounds
+    (xmin, xmax, ymin, ymax, zmin, zmax)."""
+    box = vtk.vtkBox()
+    box.SetBounds(bounds)
+    extract = vtk.vtkExtractPolyDataGeometry()
+    extract.SetInputData(polydata)
+    extract.SetImplicitFunction(box)
+    extract.ExtractInsideOn()
+    extract.ExtractBoundaryCellsOn()
+    extract.Update()
+    return extract.GetOutput()
+
+
+@proflib.profiled
+def tracestreamlines(surface, vectors, startposition, separatingdistance):
+    """Trace evenly spaced streamlines on a planar surface.
+
+    Streamlines of the point data vector array named vectors are integrated
+    with vtkEvenlySpacedStreamlines2D, in both directions from startposition,
+    with Runge-Kutta 4 at a step of a fifth of separatingdistance. New
+    streamlines are seeded at separatingdistance from existing ones and end
+    when they come closer than half that distance to another. The cost scales
+    with the number and length of the streamlines, not with the size of
+    surface. Returns polydata with one polyline per streamline.
+
+    """
+    tracer = vtk.vtkEvenlySpacedStreamlines2D()
+    tracer.SetInputData(surface)
+    tracer.SetInputArrayToProcess(
+        0, 0, 0, vtk.vtkDataObject.FIELD_ASSOCIATION_POINTS, vectors)
+    tracer.SetStartPosition(startposition)
+    tracer.SetIntegratorTypeToRungeKutta4()
+    tracer.SetIntegrationStepUnit(vtk.vtkStreamTracer.LENGTH_UNIT)
+    tracer.SetInitialIntegrationStep(separatingdistance / 5.)
+    tracer.SetMaximumNumberOfSteps(10000)
+    tracer.SetSeparatingDistance(separatingdistance)
+    tracer.SetSeparatingDistanceRatio(0.5)
+    tracer.SetClosedLoopMaximumDistance(separatingdistance / 5.)
+    tracer.SetComputeVorticity(False)
+    tracer.Update()
+    return tracer.GetOutput()
+
+
+@proflib.profiled
+def triangulate(surface):
+    """Triangulate a surface mesh."""
+    trianglefilter = vtk.vtkTriangleFilter()
+    trianglefilter.SetInputData(surface)
+    trianglefilter.Update()
+    return trianglefilter.GetOutput()
+
+
+def _clustertriangles(bins, order, triangles):
+    """Merge the points of each bin into its first point in order and return
+    the representative pointids and the remaining distinct triangles, with
+    pointids into the representatives."""
+    _, first, inverse = np.unique(bins[order], return_index=True,
+                                  return_inverse=True)
+    newids = np.empty(bins.size, dtype=np.int64)
+    newids[order] = inverse.ravel()
+    triangles = newids[triangles]
+    triangles = triangles[(triangles[:, 0] != triangles[:, 1]) &
+                          (triangles[:, 1] != triangles[:, 2]) &
+                          (triangles[:, 2] != triangles[:, 0])]
+    _, distinct = np.unique(np.sort(triangles, axis=1), axis=0,
+                            return_index=True)
+    return order[first], triangles[np.sort(distinct)]
+
+
+@proflib.profiled
+def simplify(surface, tolerance=None, targetcells=None):
+    """Simplify a planar triangulated surface for rendering.
+
+    The points of surface are clustered on a grid in its plane with cells of
+    size tolerance, e.g. the size of a pixel of the rendered figure. The points
+    of each grid cell are merged into one of them, which keeps its coordinates
+    and point data; boundary points take precedence, so the boundary moves by
+    less than tolerance. Triangles that collapse are removed. Given targetcells,
+    tolerance is increased until at most targetcells triangles remain.
+
+    The time is about linear in the number of triangles. Collapsed regions may
+    overlap slightly, so the result is meant for contour plots, not for
+    interpolation. Without tolerance and targetcells, surface is returned as is.
+
+    """
+    triangles = numpylib.gettriangles(surface)
+    if (tolerance is None and targetcells is None) or triangles.size == 0:
+        return surface
+
+    # point coordinates in the plane of surface
+    points = numpylib.getpoints(surface).astype(np.float64)
+    centered = points - points.mean(axis=0)
+    basis = np.linalg.svd(centered, full_matrices=False)[2][:2]
+    planar = centered.dot(basis.T)
+    planar -= planar.min(axis=0)
+
+    # boundary points, i.e. points on edges of a single triangle, first
+    numberofpoints = len(points)
+    edges = np.sort(triangles[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+    edges = edges[:, 0].astype(np.int64) * numberofpoints + edges[:, 1]
+    edges, counts = np.unique(edges, return_counts=True)
+    edges = edges[counts == 1]
+    boundary = np.zeros(numberofpoints, dtype=bool)
+    boundary[edges // numberofpoints] = True
+    boundary[edges % numberofpoints] = True
+    order = np.argsort(~boundary, kind='stable')
+
+    if tolerance is None:
+        # about targetcells triangles of half a grid cell each
+        area = 0.5 * np.abs(np.cross(planar[triangles[:, 1]] -
+                                     planar[triangles[:, 0]],
+                                     planar[triangles[:, 2]] -
+                                     planar[triangles[:, 0]])).sum()
+        tolerance = np.sqrt(2 * area / targetcells)
+    while True:
+        bins = np.floor(planar / tolerance).astype(np.int64)
+        bins = bins[:, 0] * (bins[:, 1].max() + 1) + bins[:, 1]
+        representatives, clustered = _clustertriangles(bins, order, triangles)
+        if targetcells is None or len(clustered) <= targetcells:
+            break
+        tolerance *= 1.05 * np.sqrt(float(len(clustered)) / targetcells)
+
+    pointdata = numpylib.getarrays(surface.GetPointData())
+    return numpylib.makepolydata(
+        points[representatives], clustered,
+        dict((name, array[representatives])
+             for name, array in pointdata.items()))
+
+
+def getcelllocator(dataset):
+    """Return static cell locator of dataset.
+
+    The locator is built once per dataset and kept in a small LRU cache, so
+    repeated probes of the same dataset skip locator construction. The cache
+    only holds a weak reference to the dataset: when the dataset is released,
+    e.g. when a script moves on to the next case, its entry is removed, so the
+    locator does not keep the dataset alive. The locator is rebuilt when the
+    dataset is modified.
+
+    """
+    def drop(reference):
+        if _celllocators.get(key, (None,))[0] is reference:
+            del _celllocators[key]
+
+    key = id(dataset)
+    entry = _celllocators.pop(key, None)
+    if (entry is None or entry[0]() is not dataset or
+            entry[1] != dataset.GetMTime()):
+        locator = vtk.vtkStaticCellLocator()
+        locator.SetDataSet(dataset)
+        locator.BuildLocator()
+        entry = (weakref.ref(dataset, drop), dataset.GetMTime(), locator)
+    _celllocators[key] = entry
+    while len(_celllocators) > CELLLOCATORCACHESIZE:
+        _celllocators.popitem(last=False)
+    return entry[2]
+
+
+@proflib.profiled
+def probedataset(dataset, probe):
+    """Probe dataset with the points of probe.
+
+    Cells of unstructured datasets are found with their cached static cell
+    locator; vtkImageData needs no locator.
+
+    """
+    prober = vtk.vtkProbeFilter()
+    prober.SetInputData(probe)
+    prober.SetSourceData(dataset)
+    if not isinstance(dataset, vtk.vtkImageData):
+        strategy = vtk.vtkCellLocatorStrategy()
+        strategy.SetCellLocator(getcelllocator(dataset))
+        prober.SetFindCellStrategy(strategy)
+    prober.Update()
+    return prober.GetOutput()
+
+
+@proflib.profiled
+def sampleline(dataset, point1, point2, spacing):
+    """Sample dataset along the segment from point1 to point2.
+
+    The segment is probed at points spacing apart, starting at point1, with the
+    cached cell locator of dataset (see probedataset). Probe points outside
+    dataset are dropped. Returns the remaining points, ordered from point1 to
+    point2, as (n, 3) nparray and their point data as dict of nparrays by
+    name. The cost depends on the number of probe points, not on the size of
+    dataset.
+
+    """
+    point1 = np.asarray(point1, dtype=float)
+    point2 = np.asarray(point2, dtype=float)
+    length = np.linalg.norm(point2 - point1)
+    count = int(np.floor(length / spacing + 1e-6)) + 1
+    t = np.arange(count) * spacing / length if length > 0 else np.zeros(1)
+    probe = vtk.vtkPolyData()
+    probe.SetPoints(numpylib.makepoints(point1 + np.outer(t, point2 - point1)))
+
+    sampled = probedataset(dataset, probe)
+    arrays = numpylib.getarrays(sampled.GetPointData())
+    valid = arrays.pop('vtkValidPointMask').astype(bool)
+    points = numpylib.getpoints(sampled)[valid]
+    return points, dict((name, array[valid]) for name, array in arrays.items())